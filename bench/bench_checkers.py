@@ -0,0 +1,124 @@
+import sys
+import time
+import asyncio
+import argparse
+import resource
+import statistics
+import multiprocessing
+
+from threading import Event
+from typing import List, Tuple, Dict
+
+from proxylib.checkers import DefaultChecker
+from proxylib.types import Proxy, ProxyType, ProxyStatus
+from proxylib.utils import EventLoopThread
+from bench.proxy_farm import FarmSettings, ProxyFarm
+
+
+def raise_nofile_limit() -> int:
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+def run_farm(settings: FarmSettings, count: int, types: List[ProxyType], connection) -> None:
+    raise_nofile_limit()
+
+    async def __main():
+        farm = ProxyFarm(settings)
+        target_port = await farm.start_target()
+        endpoints = await farm.start_proxies(count, types)
+        connection.send((target_port, endpoints))
+        await asyncio.get_event_loop().run_in_executor(None, connection.recv)
+        await farm.stop()
+
+    asyncio.run(__main())
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def run_checks(endpoints: List[Tuple[str, int, ProxyType]], target_url: str, concurrency: int,
+               timeout_s: int, lag_interval_s: float = 0.05) -> Dict[str, float]:
+    background_thread = EventLoopThread()
+    proxies = [Proxy(host, port, proxy_type) for host, port, proxy_type in endpoints]
+    latencies: List[float] = []
+    lags: List[float] = []
+    finished = Event()
+
+    async def __timed_check(session, proxy: Proxy, **kwargs) -> float:
+        started = time.monotonic()
+        await DefaultChecker.check(session, proxy, **kwargs)
+        return time.monotonic() - started
+
+    async def __measure_lag():
+        loop = asyncio.get_event_loop()
+        while not finished.is_set():
+            started = loop.time()
+            await asyncio.sleep(lag_interval_s)
+            lags.append(loop.time() - started - lag_interval_s)
+
+    lag_future = asyncio.run_coroutine_threadsafe(__measure_lag(), background_thread.loop)
+    started = time.monotonic()
+    background_thread.streaming_http_works(lambda: None, lambda proxy, result: latencies.append(result),
+                                           lambda count: finished.set(), proxies, concurrency, __timed_check,
+                                           min_speed_s=timeout_s, url_override=target_url,
+                                           pattern_override="benchmark")
+    finished.wait()
+    elapsed = time.monotonic() - started
+    lag_future.result()
+    background_thread.close()
+    good = sum(1 for proxy in proxies if proxy.status == ProxyStatus.GOOD)
+    return {
+        "concurrency": concurrency,
+        "checks": len(latencies),
+        "good": good,
+        "checks_per_s": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "lag_mean_ms": statistics.mean(lags) * 1000 if lags else 0.0,
+        "lag_max_ms": max(lags) * 1000 if lags else 0.0,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(description="Checker throughput benchmark against a local fake proxy farm")
+    parser.add_argument("--proxies", type=int, default=2000)
+    parser.add_argument("--concurrency", default="50,200,1000")
+    parser.add_argument("--types", default="HTTP,SOCKS4,SOCKS5")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--failure-rate", type=float, default=0.3)
+    parser.add_argument("--hang-rate", type=float, default=0.05)
+    parser.add_argument("--timeout", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print("RLIMIT_NOFILE: {}".format(raise_nofile_limit()))
+    settings = FarmSettings(args.latency, args.jitter, args.failure_rate, args.hang_rate)
+    types = [ProxyType[name.strip().upper()] for name in args.types.split(",")]
+    parent_connection, child_connection = multiprocessing.Pipe()
+    farm = multiprocessing.Process(target=run_farm, args=(settings, args.proxies, types, child_connection),
+                                   daemon=True)
+    farm.start()
+    target_port, endpoints = parent_connection.recv()
+    target_url = "http://127.0.0.1:{}/".format(target_port)
+
+    columns = ("concurrency", "checks", "good", "checks_per_s", "p50_ms", "p99_ms", "lag_mean_ms", "lag_max_ms",
+               "peak_rss_mb")
+    print(" ".join("{:>13}".format(column) for column in columns))
+    for concurrency in (int(value) for value in args.concurrency.split(",")):
+        result = run_checks(endpoints, target_url, concurrency, args.timeout)
+        print(" ".join("{:>13.1f}".format(result[column]) if isinstance(result[column], float)
+                       else "{:>13}".format(result[column]) for column in columns))
+    parent_connection.send("stop")
+    farm.join()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,157 @@
+import random
+import socket
+import struct
+import asyncio
+
+from typing import List, Tuple, Optional
+
+from aiohttp import web
+
+from proxylib.types import ProxyType
+
+target_body = b"<html><body>proxytool benchmark target</body></html>"
+
+
+class FarmSettings:
+    def __init__(self, latency_s: float = 0.05, latency_jitter_s: float = 0.02, failure_rate: float = 0.3,
+                 hang_rate: float = 0.05, seed: int = 0):
+        self.latency_s = latency_s
+        self.latency_jitter_s = latency_jitter_s
+        self.failure_rate = failure_rate
+        self.hang_rate = hang_rate
+        self.seed = seed
+
+
+async def pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    finally:
+        writer.close()
+
+
+async def tunnel(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, host: str, port: int,
+                 reply: bytes, head: bytes = b"") -> None:
+    target_reader, target_writer = await asyncio.open_connection(host, port)
+    if reply:
+        writer.write(reply)
+    if head:
+        target_writer.write(head)
+    await asyncio.gather(pipe(reader, target_writer), pipe(target_reader, writer))
+
+
+async def serve_http(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    head = await reader.readuntil(b"\r\n\r\n")
+    request_line, _, headers = head.partition(b"\r\n")
+    method, url, version = request_line.decode().split(" ")
+    if method == "CONNECT":
+        host, _, port = url.rpartition(":")
+        await tunnel(reader, writer, host, int(port), b"HTTP/1.1 200 Connection established\r\n\r\n")
+        return
+    host_port, _, path = url.split("://", 1)[1].partition("/")
+    host, _, port = host_port.partition(":")
+    head = "{0} /{1} {2}\r\n".format(method, path, version).encode() + headers
+    await tunnel(reader, writer, host, int(port or 80), b"", head)
+
+
+async def serve_socks4(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    version, command, port = struct.unpack("!BBH", await reader.readexactly(4))
+    address = await reader.readexactly(4)
+    await reader.readuntil(b"\x00")
+    if address[:3] == b"\x00\x00\x00" and address[3]:
+        host = (await reader.readuntil(b"\x00"))[:-1].decode()
+    else:
+        host = socket.inet_ntoa(address)
+    await tunnel(reader, writer, host, port, b"\x00\x5a" + struct.pack("!H", port) + address)
+
+
+async def serve_socks5(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    _, methods_count = await reader.readexactly(2)
+    methods = await reader.readexactly(methods_count)
+    if 0 not in methods:
+        writer.write(b"\x05\xff")
+        writer.close()
+        return
+    writer.write(b"\x05\x00")
+    _, command, _, address_type = await reader.readexactly(4)
+    if address_type == 1:
+        host = socket.inet_ntoa(await reader.readexactly(4))
+    elif address_type == 3:
+        host = (await reader.readexactly((await reader.readexactly(1))[0])).decode()
+    else:
+        host = socket.inet_ntop(socket.AF_INET6, await reader.readexactly(16))
+    port = struct.unpack("!H", await reader.readexactly(2))[0]
+    await tunnel(reader, writer, host, port, b"\x05\x00\x00\x01" + socket.inet_aton("127.0.0.1") + b"\x00\x00")
+
+
+protocol_handlers = {
+    ProxyType.HTTP: serve_http,
+    ProxyType.SOCKS4: serve_socks4,
+    ProxyType.SOCKS5: serve_socks5,
+}
+
+
+class ProxyFarm:
+    def __init__(self, settings: FarmSettings, host: str = "127.0.0.1"):
+        self.settings = settings
+        self.host = host
+        self.random = random.Random(settings.seed)
+        self.servers: List[asyncio.AbstractServer] = []
+        self.target_runner: Optional[web.AppRunner] = None
+        self.target_port: int = 0
+
+    def _make_handler(self, proxy_type: ProxyType, failing: bool, hanging: bool):
+        async def __handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            try:
+                if hanging:
+                    await reader.read()
+                    return
+                if failing:
+                    return
+                await asyncio.sleep(max(0.0, self.random.gauss(self.settings.latency_s,
+                                                               self.settings.latency_jitter_s)))
+                await protocol_handlers[proxy_type](reader, writer)
+            except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.CancelledError,
+                    ValueError):
+                pass
+            finally:
+                writer.close()
+
+        return __handle
+
+    async def start_target(self) -> int:
+        async def __target(request: web.Request) -> web.Response:
+            return web.Response(body=target_body, content_type="text/html")
+
+        app = web.Application()
+        app.router.add_route("GET", "/{tail:.*}", __target)
+        self.target_runner = web.AppRunner(app, access_log=None)
+        await self.target_runner.setup()
+        site = web.TCPSite(self.target_runner, self.host, 0)
+        await site.start()
+        self.target_port = site._server.sockets[0].getsockname()[1]
+        return self.target_port
+
+    async def start_proxies(self, count: int, types: List[ProxyType]) -> List[Tuple[str, int, ProxyType]]:
+        endpoints = []
+        for i in range(count):
+            proxy_type = types[i % len(types)]
+            roll = self.random.random()
+            hanging = roll < self.settings.hang_rate
+            failing = not hanging and roll < self.settings.hang_rate + self.settings.failure_rate
+            server = await asyncio.start_server(self._make_handler(proxy_type, failing, hanging), self.host, 0)
+            self.servers.append(server)
+            endpoints.append((self.host, server.sockets[0].getsockname()[1], proxy_type))
+        return endpoints
+
+    async def stop(self) -> None:
+        for server in self.servers:
+            server.close()
+        if self.target_runner is not None:
+            await self.target_runner.cleanup()
@@ -0,0 +1,363 @@
+import sys
+import json
+import asyncio
+import signal
+import inspect
+import argparse
+import concurrent.futures
+
+from datetime import datetime
+from threading import Event
+from typing import List, Dict, Tuple, Type, Optional, Union, Any, TextIO
+
+import proxylib.plugins
+
+from proxylib.types import ProxyResouse, ProxyChecker, Proxy, ProxyType, AnonymityLevel, ProxyStatus
+from proxylib.utils import EventLoopThread, ProxyContainer
+from proxylib.storage import ColumnarProxyContainer
+from proxylib.sharding import sharded_http_works
+from proxylib.limiter import AdaptiveLimiter
+from proxylib.sqlite_store import SqliteProxyStore
+from proxylib.rotator import ProxyRotator, start_rotating_proxy_server
+from proxylib.metrics import start_metrics_server
+from proxylib.scheduler import RecheckScheduler, scheduled_http_works
+
+
+def parse_enum_list(enum: Type, value: str) -> List[Any]:
+    return [enum[name.strip().upper()] for name in value.split(",") if name.strip()]
+
+
+def parse_target(value: str) -> Tuple[str, str]:
+    target = value.split(None, 1)
+    if len(target) != 2 or not target[0].startswith(("http://", "https://")):
+        raise argparse.ArgumentTypeError("expected 'URL PATTERN', got '{}'".format(value))
+    return target[0], target[1]
+
+
+def load_plugins(registry: proxylib.plugins.PluginRegistry, names: str) -> List[Type]:
+    return [registry.load(name.strip()) for name in (names.split(",") if names else registry.names())]
+
+
+class ProxyToolCli:
+    log_time_format = "%Y-%m-%d %H:%M:%S"
+
+    def __init__(self, args: argparse.Namespace, output: TextIO = sys.stdout):
+        self.args = args
+        self.output = output
+        self.stopping = Event()
+        self.proxy_container = ColumnarProxyContainer() if args.columnar else ProxyContainer()
+        self.proxy_store: Optional[SqliteProxyStore] = None
+        if args.db:
+            self.proxy_store = SqliteProxyStore(args.db)
+            loaded_count = self.proxy_store.load(self.proxy_container,
+                                                 parse_enum_list(ProxyStatus, args.db_load_status), args.db_load_limit)
+            self.log("{} proxies loaded from {}".format(loaded_count, args.db))
+            self.proxy_container.add_listener(self.proxy_store)
+        self.background_thread = EventLoopThread()
+        self.rotator: Optional[ProxyRotator] = None
+        self.rotating_runner = None
+        self.metrics_runner = None
+        self.scheduler: Optional[RecheckScheduler] = None
+        self.scheduler_future: Optional[concurrent.futures.Future] = None
+
+    def log(self, text: str) -> None:
+        print("[{0}] {1}".format(datetime.now().strftime(self.log_time_format), text), file=sys.stderr, flush=True)
+
+    def write_proxy(self, proxy: Proxy) -> None:
+        if self.args.format == "ndjson":
+            line = json.dumps(proxy.to_dict(self.proxy_container.export_fields))
+        else:
+            line = "{0}:{1} {2}".format(proxy.host, proxy.port, proxy.proxy_type.name)
+        print(line, file=self.output, flush=True)
+
+    def parse(self) -> None:
+        resources = load_plugins(proxylib.plugins.resources, self.args.resources)
+        done = Event()
+        self.log("Parsing {}...".format(", ".join(resource.description() for resource in resources)))
+
+        def on_result(resource: Type[ProxyResouse], result: Union[Exception, List[Proxy]]):
+            if isinstance(result, Exception):
+                self.log("{0}: an exception was thrown: {1}".format(resource.description(), result))
+                return
+            self.proxy_container.add_new_list(result)
+
+        def on_end(count: int):
+            self.log("{} new proxies added".format(count))
+            done.set()
+
+        self.background_thread.parse_http_works(lambda: None, on_result, on_end, resources,
+                                                self.proxy_container.__contains__, self.args.max_count,
+                                                min_anonymity_level=AnonymityLevel[self.args.anonymity.upper()],
+                                                types=parse_enum_list(ProxyType, self.args.types),
+                                                country=self.args.country, timeout_s=self.args.timeout)
+        done.wait()
+
+    def import_files(self) -> None:
+        default_type = None if self.args.default_type.lower() == "auto" else ProxyType[self.args.default_type.upper()]
+        untyped = []
+        for path in self.args.import_files:
+            with open(path, "r") as r:
+                if path.endswith(".ndjson"):
+                    added_count = self.proxy_container.add_from_ndjson_file(r)
+                elif path.endswith(".json"):
+                    added_count = self.proxy_container.add_from_json(r.read())
+                elif default_type is None:
+                    added_count = self.proxy_container.add_from_txt_file(
+                        r, None, on_untyped=lambda host, port: untyped.append((host, port)))
+                else:
+                    added_count = self.proxy_container.add_from_txt_file(r, lambda: default_type)
+            self.log("{} proxies added from {}".format(added_count, path))
+        if untyped:
+            self.detect_types(untyped)
+
+    def detect_types(self, addresses: List[Tuple[str, int]]) -> None:
+        fallback_type = None if self.args.undetected_type.lower() == "drop" \
+            else ProxyType[self.args.undetected_type.upper()]
+        done = Event()
+        self.log("Detecting type of {} proxies...".format(len(addresses)))
+
+        def on_end(detected_count: int, count: int):
+            self.log("{0} of {1} proxies detected, {2} undetected {3}".format(
+                detected_count, count, count - detected_count,
+                "dropped" if fallback_type is None else "added as {}".format(fallback_type.name)))
+            done.set()
+
+        self.background_thread.detect_http_works(lambda: None, self.proxy_container.add_new_list, on_end, addresses,
+                                                 self.args.threads * 10, self.args.tcp_probe_timeout,
+                                                 fallback_type=fallback_type)
+        done.wait()
+
+    def on_checked(self, proxy: Proxy, result: Any) -> None:
+        if self.proxy_store is not None:
+            self.proxy_store.record_check(proxy)
+        if self.args.stream == "all" or (self.args.stream == "good" and proxy.status == ProxyStatus.GOOD):
+            self.write_proxy(proxy)
+
+    def get_checking_kwargs(self) -> Dict[str, Any]:
+        checking_kwargs = dict(min_speed_s=self.args.timeout, max_retries=self.args.retries,
+                               url_override=self.args.url, pattern_override=self.args.pattern)
+        if self.args.targets:
+            checking_kwargs["targets"] = self.args.targets
+        return checking_kwargs
+
+    def prepare_checking(self, checking_class: Type[ProxyChecker]) -> Optional[Dict[str, Any]]:
+        checking_kwargs = self.get_checking_kwargs()
+
+        async def __prepare():
+            return await checking_class.prepare(await self.background_thread.get_session(),
+                                                allow_private_judge=self.args.allow_private_judge, **checking_kwargs)
+
+        try:
+            checking_kwargs.update(asyncio.run_coroutine_threadsafe(__prepare(), self.background_thread.loop).result())
+        except Exception as e:
+            self.log("{0} can not start: {1}".format(checking_class.description(), e))
+            return None
+        return checking_kwargs
+
+    def check(self) -> None:
+        checking_class: Type[ProxyChecker] = load_plugins(proxylib.plugins.checkers, self.args.checker)[0]
+        status_list = parse_enum_list(ProxyStatus, self.args.check_status)
+        check_list = self.proxy_container.get_all_with_status(status_list) if self.args.force \
+            else self.proxy_container.get_stale_with_status(status_list)
+        if not check_list:
+            self.log("Nothing to check")
+            return
+        done = Event()
+
+        def on_start():
+            self.log("Checking {} proxies with {} up to {} threads".format(len(check_list),
+                                                                           checking_class.description(),
+                                                                           self.args.threads))
+
+        def on_end(count: int):
+            self.log("{} proxies checked. {}".format(count, self.proxy_container.get_status()))
+            latency_percentiles = self.proxy_container.get_latency_percentiles([ProxyStatus.GOOD])
+            if all(latency is not None for latency in latency_percentiles.values()):
+                self.log("Latency of good proxies: {}".format("  ".join(
+                    "p{0}: {1}s".format(percentile, latency) for percentile, latency in latency_percentiles.items())))
+            done.set()
+
+        checking_kwargs = self.prepare_checking(checking_class)
+        if checking_kwargs is None:
+            return
+        on_result = self.on_checked
+        if self.args.processes > 1:
+            max_probe_workers = self.args.threads * 10 // self.args.processes if self.args.tcp_probe else 0
+            sharded_http_works(on_start, on_result, on_end, check_list, self.args.processes,
+                               max(1, self.args.threads // self.args.processes), checking_class.check,
+                               max_probe_workers=max_probe_workers, probe_timeout_s=self.args.tcp_probe_timeout,
+                               **checking_kwargs)
+        elif self.args.tcp_probe:
+            self.background_thread.tiered_http_works(on_start, on_result, on_end, check_list,
+                                                     self.args.threads * 10, self.args.tcp_probe_timeout,
+                                                     self.args.threads, checking_class.check, **checking_kwargs)
+        else:
+            self.background_thread.adaptive_http_works(on_start, on_result, on_end, check_list,
+                                                       AdaptiveLimiter(self.args.threads), checking_class.check,
+                                                       **checking_kwargs)
+        done.wait()
+
+    def export(self) -> None:
+        status_list = parse_enum_list(ProxyStatus, self.args.export_status)
+        path = self.args.export
+        if path == "-":
+            writer = self.proxy_container.write_all_with_status_ndjson if self.args.format == "ndjson" \
+                else self.proxy_container.write_all_with_status_txt
+            writer(self.output, status_list)
+            self.output.flush()
+            return
+        with open(path, "w+") as w:
+            if path.endswith(".ndjson"):
+                self.proxy_container.write_all_with_status_ndjson(w, status_list)
+            elif path.endswith(".json"):
+                self.proxy_container.write_all_with_status_json(w, status_list)
+            else:
+                self.proxy_container.write_all_with_status_txt(w, status_list)
+        self.log("Exported to {}".format(path))
+
+    def start_rotating_proxy(self) -> None:
+        self.rotator = ProxyRotator(self.proxy_container)
+
+        async def __start():
+            return await start_rotating_proxy_server(self.rotator, await self.background_thread.get_session(),
+                                                     self.args.rotate_host, self.args.rotate_port,
+                                                     timeout_s=self.args.timeout)
+
+        self.rotating_runner = asyncio.run_coroutine_threadsafe(__start(), self.background_thread.loop).result()
+        self.log("Rotating proxy listening on {0}:{1}".format(self.args.rotate_host, self.args.rotate_port))
+
+    def start_metrics(self) -> None:
+        self.metrics_runner = asyncio.run_coroutine_threadsafe(
+            start_metrics_server(self.background_thread.metrics, self.args.metrics_host, self.args.metrics_port),
+            self.background_thread.loop).result()
+        self.log("Metrics on http://{0}:{1}/metrics".format(self.args.metrics_host, self.args.metrics_port))
+
+    def start_scheduler(self) -> None:
+        checking_class: Type[ProxyChecker] = load_plugins(proxylib.plugins.checkers, self.args.checker)[0]
+        checking_kwargs = self.prepare_checking(checking_class)
+        if checking_kwargs is None:
+            return
+        self.scheduler = RecheckScheduler(self.proxy_container, self.args.recheck_rate)
+        self.scheduler_future = scheduled_http_works(
+            self.background_thread, lambda: None, self.on_checked,
+            lambda count: self.log("Scheduler stopped after {} checks".format(count)), self.scheduler,
+            self.args.threads, checking_class.check, **checking_kwargs)
+        self.log("Re-checking due proxies with {0} at up to {1} checks/s".format(checking_class.description(),
+                                                                               self.args.recheck_rate))
+
+    def run_once(self) -> None:
+        if self.args.parse:
+            self.parse()
+        if self.args.import_files:
+            self.import_files()
+        if self.args.check and self.scheduler is None:
+            self.check()
+        if self.args.export:
+            self.export()
+
+    def run_daemon(self) -> None:
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stopping.set())
+        signal.signal(signal.SIGINT, lambda signum, frame: self.stopping.set())
+        while not self.stopping.is_set():
+            self.run_once()
+            self.stopping.wait(self.args.interval)
+        self.log("Stopping")
+
+    def close(self) -> None:
+        if self.scheduler is not None:
+            self.scheduler.close()
+            try:
+                self.scheduler_future.result(self.args.timeout * self.args.retries + self.scheduler.idle_poll_s + 1)
+            except concurrent.futures.TimeoutError:
+                self.scheduler_future.cancel()
+        if self.rotating_runner is not None:
+            asyncio.run_coroutine_threadsafe(self.rotating_runner.cleanup(), self.background_thread.loop).result()
+            self.rotator.close()
+        if self.metrics_runner is not None:
+            asyncio.run_coroutine_threadsafe(self.metrics_runner.cleanup(), self.background_thread.loop).result()
+        self.background_thread.close()
+        if self.proxy_store is not None:
+            self.proxy_store.close()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    all_statuses = ",".join(status.name for status in ProxyStatus)
+    parser = argparse.ArgumentParser(description="Headless proxytool: parse, import, check and export proxy lists")
+    parser.add_argument("--parse", action="store_true", help="parse proxies from resources")
+    parser.add_argument("--resources", default="", help="comma separated resource names or module:Class "
+                                                        "targets, all registered resources by default")
+    parser.add_argument("--max-count", type=int, default=200)
+    parser.add_argument("--anonymity", default=AnonymityLevel.NONE.name)
+    parser.add_argument("--types", default=",".join(proxy_type.name for proxy_type in ProxyType))
+    parser.add_argument("--country", default="")
+    parser.add_argument("--import", dest="import_files", action="append", default=[], metavar="FILE",
+                        help="import a txt, json or ndjson proxy list, can be repeated")
+    parser.add_argument("--default-type", default="auto",
+                        help="type used for txt lines without one, 'auto' probes each proxy for its protocol")
+    parser.add_argument("--undetected-type", default=ProxyType.HTTP.name,
+                        help="type given to proxies whose protocol 'auto' could not detect, 'drop' discards them")
+    parser.add_argument("--check", action="store_true", help="check proxies")
+    parser.add_argument("--force", action="store_true", help="also re-check proxies checked within their ttl")
+    parser.add_argument("--checker", default="default", help="registered checker name or module:Class target")
+    parser.add_argument("--check-status", default=all_statuses)
+    parser.add_argument("--threads", type=int, default=25)
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--timeout", type=int, default=15)
+    parser.add_argument("--retries", type=int, default=1)
+    parser.add_argument("--url", default="", help="check url, required for --checker judge")
+    parser.add_argument("--pattern", default="")
+    parser.add_argument("--allow-private-judge", action="store_true",
+                        help="accept a loopback or private judge address, for proxies in the same network")
+    parser.add_argument("--target", dest="targets", action="append", default=[], type=parse_target,
+                        metavar="'URL PATTERN'",
+                        help="check target for --checker multi, can be repeated")
+    parser.add_argument("--tcp-probe", action="store_true")
+    parser.add_argument("--tcp-probe-timeout", type=float, default=3)
+    parser.add_argument("--stream", choices=("good", "all", "none"), default="good",
+                        help="which check results are written to stdout as they arrive")
+    parser.add_argument("--format", choices=("txt", "ndjson"), default="txt")
+    parser.add_argument("--export", default="", metavar="PATH", help="export file, '-' for stdout")
+    parser.add_argument("--export-status", default=ProxyStatus.GOOD.name)
+    parser.add_argument("--columnar", action="store_true", help="use the compact columnar container")
+    parser.add_argument("--db", default="", help="sqlite database to load from and persist to")
+    parser.add_argument("--db-load-status", default=all_statuses, help="statuses to load from --db")
+    parser.add_argument("--db-load-limit", type=int, default=0,
+                        help="load at most this many proxies from --db, lowest latency first, 0 for all")
+    parser.add_argument("--rotate-port", type=int, default=0,
+                        help="serve good proxies through a local rotating http proxy on this port, runs until stopped")
+    parser.add_argument("--rotate-host", default="127.0.0.1")
+    parser.add_argument("--metrics-port", type=int, default=0, help="serve prometheus metrics on this port")
+    parser.add_argument("--metrics-host", default="127.0.0.1")
+    parser.add_argument("--recheck-rate", type=float, default=0,
+                        help="keep re-checking proxies as they become due at up to this many checks per second, "
+                             "runs until stopped")
+    parser.add_argument("--daemon", action="store_true", help="repeat the selected steps until stopped")
+    parser.add_argument("--interval", type=float, default=300, help="seconds between daemon runs")
+    return parser
+
+
+def main(argv: List[str]) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.targets and "targets" not in inspect.signature(
+            load_plugins(proxylib.plugins.checkers, args.checker)[0].check).parameters:
+        parser.error("--target is only supported by checkers that take targets, such as --checker multi")
+    cli = ProxyToolCli(args)
+    try:
+        if args.metrics_port:
+            cli.start_metrics()
+        if args.rotate_port:
+            cli.start_rotating_proxy()
+        if args.recheck_rate:
+            cli.start_scheduler()
+        if args.daemon or args.rotate_port or args.recheck_rate:
+            cli.run_daemon()
+        else:
+            cli.run_once()
+    finally:
+        cli.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,19 +1,50 @@
 import re
+import time
+import codecs
+import ipaddress
+import asyncio
 import aiohttp
 
-from datetime import datetime
+from typing import Dict, List, Tuple, Optional
 
-from proxylib.types import ProxyChecker, ProxyStatus, Proxy
+from yarl import URL
+
+from proxylib.types import ProxyChecker, ProxyStatus, Proxy, ProxyType, AnonymityLevel, CheckError
+from proxylib.judge import judge_marker
+from proxylib.errors import record_exception
 
 
 class DefaultChecker(ProxyChecker):
     default_url = "https://www.google.com/"
     default_pattern = "google"
+    chunk_size = 4096
+    max_body_bytes = 256 * 1024
+    # Tail of the already searched text kept so that matches spanning two chunks are still found
+    search_overlap = 1024
 
     @classmethod
     def description(cls) -> str:
         return "Default(google.com)"
 
+    @classmethod
+    async def search_body(cls, response: aiohttp.ClientResponse, pattern: str, max_body_bytes: int) -> bool:
+        compiled_pattern = re.compile(pattern)
+        try:
+            decoder = codecs.getincrementaldecoder(response.charset or "utf-8")(errors="replace")
+        except LookupError:
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        read_bytes = 0
+        tail = ""
+        async for chunk in response.content.iter_chunked(cls.chunk_size):
+            read_bytes += len(chunk)
+            text = tail + decoder.decode(chunk)
+            if compiled_pattern.search(text):
+                return True
+            if read_bytes >= max_body_bytes:
+                return False
+            tail = text[-cls.search_overlap:]
+        return bool(compiled_pattern.search(tail + decoder.decode(b"", final=True)))
+
     @classmethod
     async def check(
             cls,
@@ -23,24 +54,238 @@ class DefaultChecker(ProxyChecker):
             max_retries: int = 1,
             url_override: str = "",
             pattern_override: str = "",
+            max_body_bytes: int = 0,
     ) -> None:
         url = url_override if len(url_override) > 3 else cls.default_url
         pattern = pattern_override if len(pattern_override) > 3 else cls.default_pattern
-        now = datetime.now()
-        if "checking_exceptions" not in proxy.runtime_data:
-            proxy.runtime_data["checking_exceptions"] = list()
+        proxy.runtime_data.pop("checking_exceptions", None)
         while max_retries:
+            started = time.monotonic()
             try:
                 async with session.get(url, proxy=proxy.proxy_string.replace("https", "http"),
                                        timeout=min_speed_s) as response:
-                    text = await response.text()
-                if re.search(pattern, text):
-                    proxy.status = ProxyStatus.GOOD
-                    proxy.runtime_data["checking_elapsed"] = round((datetime.now() - now).total_seconds(), 2)
-                else:
+                    found = await cls.search_body(response, pattern, max_body_bytes or cls.max_body_bytes)
+                proxy.record_latency(time.monotonic() - started, found)
+                if not found:
+                    error = CheckError.HTTP_STATUS if response.status >= 400 else CheckError.PATTERN_MISMATCH
+                    proxy.record_error(error, "HTTP {0}, '{1}' not found".format(response.status, pattern))
+                proxy.status = ProxyStatus.GOOD if found else ProxyStatus.BAD
+                break
+            except Exception as e:
+                proxy.record_latency(time.monotonic() - started, False)
+                record_exception(proxy, e, cls.check.__qualname__)
+                proxy.status = ProxyStatus.ERROR
+                max_retries -= 1
+        proxy.mark_checked()
+
+
+class JudgeChecker(ProxyChecker):
+    leaking_headers = ("x-forwarded-for", "x-real-ip", "forwarded", "client-ip", "x-client-ip", "x-originating-ip",
+                       "x-proxy-id", "via", "proxy-connection", "x-forwarded-host", "x-forwarded-proto")
+    ip_headers = ("x-forwarded-for", "x-real-ip", "forwarded", "client-ip", "x-client-ip", "x-originating-ip")
+
+    @classmethod
+    def description(cls) -> str:
+        return "Judge(anonymity)"
+
+    @classmethod
+    async def prepare(cls, session: aiohttp.ClientSession, min_speed_s: int = 15, url_override: str = "",
+                      allow_private_judge: bool = False, **checking_kwargs) -> Dict[str, str]:
+        if len(url_override) <= 3:
+            raise ValueError("a judge url reachable from the proxies is required")
+        host = URL(url_override).host or ""
+        try:
+            is_global = ipaddress.ip_address(host).is_global
+        except ValueError:
+            is_global = host != "localhost"
+        if not is_global and not allow_private_judge:
+            raise ValueError("judge host {0} is not reachable from remote proxies, allow private judges if the "
+                             "proxies run in the same network".format(host))
+        async with session.get(url_override, timeout=min_speed_s) as response:
+            judge_response = await response.json(content_type=None)
+        if not isinstance(judge_response, dict) or judge_response.get("judge") != judge_marker:
+            raise ValueError("{0} is not a proxytool judge".format(url_override))
+        return {"real_ip": judge_response["remote"]}
+
+    @classmethod
+    def classify(cls, judge_response: Dict, real_ip: str) -> AnonymityLevel:
+        headers = {key.lower(): value for key, value in judge_response["headers"].items()
+                   if key.lower() in cls.leaking_headers}
+        if judge_response["remote"] == real_ip or any(real_ip in re.split(r"[\s,;=\"\[\]]+", value)
+                                                      for value in headers.values()):
+            return AnonymityLevel.NONE
+        if any(header in headers for header in cls.ip_headers):
+            return AnonymityLevel.LOW
+        if any(header in headers for header in cls.leaking_headers):
+            return AnonymityLevel.MEDIUM
+        return AnonymityLevel.HIGH
+
+    @classmethod
+    async def check(
+            cls,
+            session: aiohttp.ClientSession,
+            proxy: Proxy,
+            min_speed_s: int = 15,
+            max_retries: int = 1,
+            url_override: str = "",
+            pattern_override: str = "",
+            real_ip: str = "",
+    ) -> None:
+        if not real_ip:
+            raise ValueError("JudgeChecker.prepare has to resolve the real address before checking")
+        proxy.runtime_data.pop("checking_exceptions", None)
+        while max_retries:
+            started = time.monotonic()
+            try:
+                async with session.get(url_override, proxy=proxy.proxy_string.replace("https", "http"),
+                                       timeout=min_speed_s) as response:
+                    judge_response = await response.json(content_type=None)
+                elapsed = time.monotonic() - started
+                if not isinstance(judge_response, dict) or judge_response.get("judge") != judge_marker:
+                    proxy.record_latency(elapsed, False)
+                    proxy.record_error(CheckError.PATTERN_MISMATCH, "HTTP {0}, not a judge response".format(
+                        response.status))
                     proxy.status = ProxyStatus.BAD
-                return
+                    break
+                proxy.anonymity = cls.classify(judge_response, real_ip)
+                proxy.record_latency(elapsed, True)
+                proxy.status = ProxyStatus.GOOD
+                break
             except Exception as e:
-                proxy.runtime_data["checking_exceptions"].append(str(e))
+                proxy.record_latency(time.monotonic() - started, False)
+                record_exception(proxy, e, cls.check.__qualname__)
                 proxy.status = ProxyStatus.ERROR
                 max_retries -= 1
+        proxy.mark_checked()
+
+
+class MultiTargetChecker(DefaultChecker):
+    default_targets: Tuple[Tuple[str, str], ...] = (("http://www.google.com/", "google"),
+                                                    ("http://www.bing.com/", "bing"))
+    # Targets that have to pass for GOOD, 0 means all of them
+    min_passed_targets = 0
+
+    @classmethod
+    def description(cls) -> str:
+        return "MultiTarget(kept-alive)"
+
+    @staticmethod
+    async def read_response(reader: asyncio.StreamReader, max_body_bytes: int) -> Tuple[int, bytes, bool]:
+        status_line = (await reader.readline()).decode("latin-1").split()
+        if not status_line:
+            raise aiohttp.ServerDisconnectedError()
+        version, status = status_line[0], status_line[1]
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip().lower()
+        keep_alive = version == "HTTP/1.1" and "close" not in (headers.get("connection", ""),
+                                                                headers.get("proxy-connection", ""))
+        body = bytearray()
+        if "chunked" in headers.get("transfer-encoding", ""):
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                body += await reader.readexactly(size)
+                await reader.readline()
+                if len(body) >= max_body_bytes:
+                    return int(status), bytes(body), False
+        elif "content-length" in headers:
+            length = int(headers["content-length"])
+            body += await reader.readexactly(min(length, max_body_bytes))
+            keep_alive = keep_alive and length <= max_body_bytes
+        elif int(status) not in (204, 304) and not 100 <= int(status) < 200:
+            body += await reader.read(max_body_bytes)
+            keep_alive = False
+        return int(status), bytes(body), keep_alive
+
+    @classmethod
+    async def request_over_proxy(cls, connection: Tuple[asyncio.StreamReader, asyncio.StreamWriter], proxy: Proxy,
+                                 url: str, max_body_bytes: int) -> Tuple[int, str, bool]:
+        reader, writer = connection
+        target = URL(url)
+        headers = ["GET {0} HTTP/1.1".format(target), "Host: {0}".format(target.raw_authority),
+                   "Accept: */*", "Connection: keep-alive", "Proxy-Connection: keep-alive"]
+        if proxy.login:
+            headers.append("Proxy-Authorization: {0}".format(aiohttp.BasicAuth(proxy.login, proxy.password).encode()))
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+        status, body, keep_alive = await cls.read_response(reader, max_body_bytes)
+        return status, body.decode("utf-8", "replace"), keep_alive
+
+    @classmethod
+    async def check(
+            cls,
+            session: aiohttp.ClientSession,
+            proxy: Proxy,
+            min_speed_s: int = 15,
+            max_retries: int = 1,
+            url_override: str = "",
+            pattern_override: str = "",
+            max_body_bytes: int = 0,
+            targets: Optional[List[Tuple[str, str]]] = None,
+    ) -> None:
+        if not targets:
+            targets = [(url_override, pattern_override)] if len(url_override) > 3 else cls.default_targets
+        max_body_bytes = max_body_bytes or cls.max_body_bytes
+        # One connection to an http proxy serves every plain http target in turn while the proxy keeps it alive,
+        # the rest go through the session pool which reuses connections per target host
+        connection: Optional[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = None
+        results = {}
+        try:
+            for url, pattern in targets:
+                retries = max_retries
+                while retries:
+                    started = time.monotonic()
+                    reused = connection is not None
+                    try:
+                        if proxy.proxy_type in (ProxyType.HTTP, ProxyType.HTTPS) and url.startswith("http://"):
+                            if connection is None:
+                                connection = await asyncio.wait_for(asyncio.open_connection(proxy.host, proxy.port),
+                                                                    min_speed_s)
+                            status, text, keep_alive = await asyncio.wait_for(
+                                cls.request_over_proxy(connection, proxy, url, max_body_bytes), min_speed_s)
+                            found = re.search(pattern, text) is not None
+                            if not keep_alive:
+                                connection[1].close()
+                                connection = None
+                        else:
+                            async with session.get(url, proxy=proxy.proxy_string.replace("https", "http"),
+                                                   timeout=min_speed_s) as response:
+                                status = response.status
+                                found = await cls.search_body(response, pattern, max_body_bytes)
+                        elapsed = time.monotonic() - started
+                        proxy.record_latency(elapsed, found)
+                        if not found:
+                            error = CheckError.HTTP_STATUS if status >= 400 else CheckError.PATTERN_MISMATCH
+                            proxy.record_error(error, "{0}: HTTP {1}, '{2}' not found".format(url, status, pattern))
+                        results[url] = {"ok": found, "status": status, "elapsed": round(elapsed, 3)}
+                        break
+                    except Exception as e:
+                        if connection is not None:
+                            connection[1].close()
+                            connection = None
+                        if reused and isinstance(e, aiohttp.ServerDisconnectedError):
+                            # The proxy dropped the idle connection, reconnect without using up a retry
+                            continue
+                        proxy.record_latency(time.monotonic() - started, False)
+                        results[url] = {"ok": False, "error": record_exception(proxy, e, cls.check.__qualname__).name}
+                        retries -= 1
+        finally:
+            if connection is not None:
+                connection[1].close()
+        proxy.runtime_data["targets"] = results
+        passed = sum(1 for result in results.values() if result["ok"])
+        if passed >= (cls.min_passed_targets or len(targets)):
+            proxy.status = ProxyStatus.GOOD
+        elif any("error" not in result for result in results.values()):
+            proxy.status = ProxyStatus.BAD
+        else:
+            proxy.status = ProxyStatus.ERROR
+        proxy.mark_checked()
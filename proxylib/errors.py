@@ -0,0 +1,49 @@
+import errno
+import asyncio
+import aiohttp
+
+from typing import Optional
+
+from aiosocksy.errors import SocksError, SocksConnectionError
+
+from proxylib.types import CheckError, Proxy
+from proxylib.limiter import local_errnos, is_local_error_message
+from proxylib.metrics import Metrics, current_metrics
+
+refused_errnos = (errno.ECONNREFUSED, errno.EHOSTUNREACH, errno.ENETUNREACH, errno.EHOSTDOWN)
+reset_errnos = (errno.ECONNRESET, errno.ECONNABORTED, errno.EPIPE)
+
+
+def classify_exception(e: BaseException) -> CheckError:
+    if isinstance(e, asyncio.TimeoutError):
+        return CheckError.TIMEOUT
+    os_error = e.os_error if isinstance(e, aiohttp.ClientConnectorError) else e
+    # aiosocksy replaces the errno of a failed connection to the proxy with a message, the original is the cause
+    if isinstance(os_error, SocksConnectionError) and isinstance(os_error.__cause__, OSError):
+        os_error = os_error.__cause__
+    code = getattr(os_error, "errno", None) if isinstance(os_error, OSError) else None
+    if code in local_errnos or is_local_error_message(str(e)):
+        return CheckError.LOCAL
+    if code in refused_errnos or isinstance(os_error, ConnectionRefusedError):
+        return CheckError.REFUSED
+    if code in reset_errnos or isinstance(e, (ConnectionResetError, aiohttp.ServerDisconnectedError,
+                                              aiohttp.ClientPayloadError)):
+        return CheckError.RESET
+    if isinstance(e, SocksError) or isinstance(os_error, (SocksError, SocksConnectionError)):
+        return CheckError.SOCKS_HANDSHAKE
+    if isinstance(e, aiohttp.ClientResponseError):
+        return CheckError.HTTP_STATUS
+    return CheckError.OTHER
+
+
+def count_exception(e: BaseException, worker: str, metrics: Optional[Metrics] = None) -> CheckError:
+    error = classify_exception(e)
+    metrics = metrics or current_metrics.get()
+    metrics.inc("proxytool_check_errors_total", {"worker": worker, "error": error.name, "exception": type(e).__name__})
+    return error
+
+
+def record_exception(proxy: Proxy, e: BaseException, worker: str) -> CheckError:
+    error = count_exception(e, worker)
+    proxy.record_error(error, str(e) or type(e).__name__)
+    return error
@@ -0,0 +1,28 @@
+import sys
+import argparse
+
+from aiohttp import web
+
+judge_marker = "proxytool-judge"
+
+
+async def judge_handler(request: web.Request) -> web.Response:
+    return web.json_response({
+        "judge": judge_marker,
+        "remote": request.remote,
+        "headers": dict(request.headers),
+    })
+
+
+def create_judge_app() -> web.Application:
+    app = web.Application()
+    app.router.add_route("GET", "/{tail:.*}", judge_handler)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Proxy judge that echoes request headers and client address")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8899)
+    args = parser.parse_args(sys.argv[1:])
+    web.run_app(create_judge_app(), host=args.host, port=args.port, access_log=None)
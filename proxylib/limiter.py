@@ -0,0 +1,79 @@
+import os
+import errno
+import asyncio
+import resource
+
+from typing import Optional
+
+local_errnos = (errno.EMFILE, errno.ENFILE, errno.ENOBUFS, errno.EADDRNOTAVAIL, errno.ENOMEM)
+local_error_messages = tuple(os.strerror(code) for code in local_errnos)
+
+
+def is_local_error_message(message: str) -> bool:
+    return any(local_message in message for local_message in local_error_messages)
+
+
+def get_nofile_limit(unlimited: int = 1 << 20) -> int:
+    limit = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    return unlimited if limit == resource.RLIM_INFINITY else limit
+
+
+class AdaptiveLimiter:
+    def __init__(self, max_limit: int, min_limit: int = 1, initial_limit: Optional[int] = None,
+                 increase_factor: float = 2.0, decrease_factor: float = 0.5, error_rate_threshold: float = 0.02,
+                 lag_threshold_s: float = 0.1, lag_interval_s: float = 0.05, fd_reserve: int = 64):
+        self.max_limit = max(min_limit, min(max_limit, get_nofile_limit() - fd_reserve))
+        self.min_limit = min_limit
+        # Start at the requested bound, the limit only drops on local errors or event loop lag
+        self.limit = min(self.max_limit, initial_limit or self.max_limit)
+        self.increase_factor = increase_factor
+        self.decrease_factor = decrease_factor
+        self.error_rate_threshold = error_rate_threshold
+        self.lag_threshold_s = lag_threshold_s
+        self.lag_interval_s = lag_interval_s
+        self.in_flight = 0
+        self.lag_s = 0.0
+        self.window_completed = 0
+        self.window_local_errors = 0
+        self._condition: Optional[asyncio.Condition] = None
+        self._lag_task: Optional[asyncio.Task] = None
+
+    async def _measure_lag(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.lag_interval_s)
+            self.lag_s = 0.8 * self.lag_s + 0.2 * max(0.0, loop.time() - started - self.lag_interval_s)
+
+    async def acquire(self) -> None:
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+            self._lag_task = asyncio.ensure_future(self._measure_lag())
+        async with self._condition:
+            while self.in_flight >= self.limit:
+                await self._condition.wait()
+            self.in_flight += 1
+
+    async def release(self, local_errors: int = 0) -> None:
+        self.window_completed += 1
+        self.window_local_errors += local_errors
+        if self.window_completed >= max(10, self.limit):
+            self._adjust()
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify(max(1, self.limit - self.in_flight))
+
+    def _adjust(self) -> None:
+        error_rate = self.window_local_errors / self.window_completed
+        if error_rate > self.error_rate_threshold or self.lag_s > self.lag_threshold_s:
+            self.limit = max(self.min_limit, int(self.limit * self.decrease_factor))
+        else:
+            self.limit = min(self.max_limit, max(self.limit + 1, int(self.limit * self.increase_factor)))
+        self.window_completed = 0
+        self.window_local_errors = 0
+
+    def close(self) -> None:
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            self._lag_task = None
+        self._condition = None
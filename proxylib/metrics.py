@@ -0,0 +1,155 @@
+import time
+import asyncio
+
+from threading import Lock
+from contextvars import ContextVar
+from typing import Dict, List, Tuple, Callable, Optional, Any
+
+from aiohttp import web
+
+from proxylib.stats import latency_buckets_s
+
+Labels = Tuple[Tuple[str, str], ...]
+
+metric_descriptions = {
+    "proxytool_checks_started_total": ("counter", "Checks handed to a worker"),
+    "proxytool_checks_completed_total": ("counter", "Checks finished by a worker"),
+    "proxytool_checks_in_flight": ("gauge", "Checks currently running"),
+    "proxytool_check_results_total": ("counter", "Finished checks by resulting proxy status"),
+    "proxytool_check_errors_total": ("counter", "Exceptions raised while checking, by error class and exception"),
+    "proxytool_check_duration_seconds": ("histogram", "Wall time of a whole check including retries"),
+    "proxytool_event_loop_lag_seconds": ("gauge", "Delay of each event loop waking up from a timer"),
+    "proxytool_open_connections": ("gauge", "Connections held by the client sessions of all event loops"),
+}
+
+
+def make_labels(labels: Optional[Dict[str, str]]) -> Labels:
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = labels + (extra,) if extra else labels
+    if not pairs:
+        return ""
+    return "{" + ",".join('{0}="{1}"'.format(key, str(value).replace("\\", "\\\\").replace("\n", "\\n")
+                                              .replace('"', '\\"')) for key, value in pairs) + "}"
+
+
+class Metrics:
+    def __init__(self, buckets: Tuple[float, ...] = latency_buckets_s):
+        self.buckets = buckets
+        self.values: Dict[str, Dict[Labels, float]] = {}
+        self.histograms: Dict[str, Dict[Labels, List[float]]] = {}
+        # Gauges read on demand, the values of every function registered under a name are summed
+        self.gauge_functions: Dict[str, List[Callable[[], float]]] = {}
+        self._lock = Lock()
+
+    def inc(self, name: str, labels: Optional[Dict[str, str]] = None, value: float = 1) -> None:
+        key = make_labels(labels)
+        with self._lock:
+            series = self.values.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        with self._lock:
+            self.values.setdefault(name, {})[make_labels(labels)] = value
+
+    def remove(self, name: str, labels: Optional[Dict[str, str]] = None) -> None:
+        with self._lock:
+            self.values.get(name, {}).pop(make_labels(labels), None)
+
+    def add_function(self, name: str, function: Callable[[], float]) -> None:
+        with self._lock:
+            self.gauge_functions.setdefault(name, []).append(function)
+
+    def remove_function(self, name: str, function: Callable[[], float]) -> None:
+        with self._lock:
+            functions = self.gauge_functions.get(name, [])
+            if function in functions:
+                functions.remove(function)
+            if not functions:
+                self.gauge_functions.pop(name, None)
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        key = make_labels(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            # Per bucket counts followed by the overflow bucket, the sum and the count
+            histogram = series.setdefault(key, [0] * (len(self.buckets) + 3))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[index] += 1
+                    break
+            else:
+                histogram[len(self.buckets)] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def get(self, name: str, labels: Optional[Dict[str, str]] = None) -> float:
+        if name in self.gauge_functions:
+            return sum(function() for function in list(self.gauge_functions[name]))
+        return self.values.get(name, {}).get(make_labels(labels), 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            snapshot: Dict[str, Any] = {name: dict(series) for name, series in self.values.items()}
+            snapshot.update({name: {key: list(histogram) for key, histogram in series.items()}
+                             for name, series in self.histograms.items()})
+            gauge_functions = {name: list(functions) for name, functions in self.gauge_functions.items()}
+        for name, functions in gauge_functions.items():
+            snapshot[name] = {(): sum(function() for function in functions)}
+        return snapshot
+
+    def render(self) -> str:
+        snapshot = self.snapshot()
+        lines = []
+        for name in sorted(snapshot):
+            type_, description = metric_descriptions.get(name, ("untyped", name))
+            lines.append("# HELP {0} {1}".format(name, description))
+            lines.append("# TYPE {0} {1}".format(name, type_))
+            for labels, value in sorted(snapshot[name].items()):
+                if not isinstance(value, list):
+                    lines.append("{0}{1} {2}".format(name, format_labels(labels), value))
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), value):
+                    cumulative += count
+                    lines.append("{0}_bucket{1} {2}".format(
+                        name, format_labels(labels, ("le", "+Inf" if bound == float("inf") else repr(bound))),
+                        cumulative))
+                lines.append("{0}_sum{1} {2}".format(name, format_labels(labels), value[-2]))
+                lines.append("{0}_count{1} {2}".format(name, format_labels(labels), value[-1]))
+        return "\n".join(lines) + "\n"
+
+
+default_metrics = Metrics()
+# Registry of the event loop thread running the current check, for code that is not handed one explicitly
+current_metrics: ContextVar[Metrics] = ContextVar("current_metrics", default=default_metrics)
+
+
+async def measure_event_loop_lag(metrics: Metrics, interval_s: float = 0.5,
+                                 labels: Optional[Dict[str, str]] = None) -> None:
+    while True:
+        started = time.monotonic()
+        await asyncio.sleep(interval_s)
+        metrics.set("proxytool_event_loop_lag_seconds", max(0.0, time.monotonic() - started - interval_s), labels)
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(body=request.app["metrics"].render().encode(),
+                        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+def create_metrics_app(metrics: Metrics = default_metrics) -> web.Application:
+    app = web.Application()
+    app["metrics"] = metrics
+    app.router.add_route("GET", "/metrics", metrics_handler)
+    return app
+
+
+async def start_metrics_server(metrics: Metrics = default_metrics, host: str = "127.0.0.1",
+                               port: int = 9464) -> web.AppRunner:
+    runner = web.AppRunner(create_metrics_app(metrics), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
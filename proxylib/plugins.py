@@ -0,0 +1,65 @@
+import importlib
+
+from typing import Dict, List, Type, Any, Optional
+
+from proxylib.types import ProxyResouse, ProxyChecker
+
+
+def get_entry_points(group: str) -> Dict[str, str]:
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        return {}
+    all_entry_points = entry_points()
+    if hasattr(all_entry_points, "select"):
+        selected = all_entry_points.select(group=group)
+    else:
+        selected = all_entry_points.get(group, [])
+    return {entry_point.name: entry_point.value for entry_point in selected}
+
+
+class PluginRegistry:
+    def __init__(self, group: str, base_class: Type, builtins: Dict[str, str]):
+        self.group = group
+        self.base_class = base_class
+        self.builtins = builtins
+        self._targets: Optional[Dict[str, str]] = None
+        self._loaded: Dict[str, Type[Any]] = {}
+
+    @property
+    def targets(self) -> Dict[str, str]:
+        if self._targets is None:
+            self._targets = dict(self.builtins)
+            self._targets.update(get_entry_points(self.group))
+        return self._targets
+
+    def register(self, name: str, target: str) -> None:
+        self.targets[name] = target
+        self._loaded.pop(name, None)
+
+    def names(self) -> List[str]:
+        return list(self.targets)
+
+    def load(self, name: str) -> Type[Any]:
+        if name in self._loaded:
+            return self._loaded[name]
+        target = self.targets.get(name, name)
+        module_name, _, class_name = target.partition(":")
+        if not class_name:
+            raise KeyError("Unknown {0} plugin: {1}".format(self.group, name))
+        class_ = getattr(importlib.import_module(module_name), class_name)
+        if not issubclass(class_, self.base_class):
+            raise TypeError("{0} is not a {1}".format(target, self.base_class.__name__))
+        self._loaded[name] = class_
+        return class_
+
+
+resources = PluginRegistry("proxytool.resources", ProxyResouse, {
+    "spys.me": "proxylib.resources:SpysMe",
+})
+
+checkers = PluginRegistry("proxytool.checkers", ProxyChecker, {
+    "default": "proxylib.checkers:DefaultChecker",
+    "judge": "proxylib.checkers:JudgeChecker",
+    "multi": "proxylib.checkers:MultiTargetChecker",
+})
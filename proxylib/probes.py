@@ -0,0 +1,83 @@
+import socket
+import struct
+import asyncio
+import aiohttp
+
+from typing import Tuple, Optional
+
+from proxylib.types import Proxy, ProxyStatus, ProxyType, CheckError
+from proxylib.errors import record_exception, classify_exception
+
+detect_connect_target = ("www.google.com", 443)
+detect_socks4_target = ("8.8.8.8", 53)
+# Protocol picked when a server answers more than one handshake
+detect_preference = (ProxyType.HTTPS, ProxyType.HTTP, ProxyType.SOCKS5, ProxyType.SOCKS4)
+# Handshakes detect_proxy_type runs at once, each on its own socket
+detect_sockets_per_address = 3
+
+
+async def tcp_probe(session: aiohttp.ClientSession, proxy: Proxy, timeout_s: float = 3) -> bool:
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(proxy.host, proxy.port), timeout_s)
+    except (OSError, asyncio.TimeoutError) as e:
+        record_exception(proxy, e, tcp_probe.__qualname__)
+        proxy.status = ProxyStatus.ERROR
+        proxy.mark_checked()
+        return False
+    writer.close()
+    return True
+
+
+async def exchange(host: str, port: int, request: bytes, reply_size: int, timeout_s: float) -> bytes:
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout_s)
+    try:
+        writer.write(request)
+        return await asyncio.wait_for(reader.read(reply_size), timeout_s)
+    finally:
+        writer.close()
+
+
+async def probe_http(host: str, port: int, timeout_s: float) -> Optional[ProxyType]:
+    target = "{0}:{1}".format(*detect_connect_target)
+    reply = await exchange(host, port, "CONNECT {0} HTTP/1.1\r\nHost: {0}\r\n\r\n".format(target).encode(), 64,
+                           timeout_s)
+    if not reply.startswith(b"HTTP/"):
+        return None
+    return ProxyType.HTTPS if reply.split(None, 2)[1:2] == [b"200"] else ProxyType.HTTP
+
+
+async def probe_socks4(host: str, port: int, timeout_s: float) -> Optional[ProxyType]:
+    target_host, target_port = detect_socks4_target
+    reply = await exchange(host, port, struct.pack(">BBH4sB", 4, 1, target_port, socket.inet_aton(target_host), 0), 8,
+                           timeout_s)
+    return ProxyType.SOCKS4 if len(reply) >= 2 and reply[0] == 0 and 0x5A <= reply[1] <= 0x5D else None
+
+
+async def probe_socks5(host: str, port: int, timeout_s: float) -> Optional[ProxyType]:
+    reply = await exchange(host, port, b"\x05\x02\x00\x02", 2, timeout_s)
+    return ProxyType.SOCKS5 if len(reply) == 2 and reply[0] == 5 else None
+
+
+async def detect_proxy_type(host: str, port: int, timeout_s: float = 3) -> Optional[ProxyType]:
+    answers = await asyncio.gather(probe_http(host, port, timeout_s), probe_socks4(host, port, timeout_s),
+                                   probe_socks5(host, port, timeout_s), return_exceptions=True)
+    for proxy_type in detect_preference:
+        if proxy_type in answers:
+            return proxy_type
+    # Running out of sockets or ports says nothing about the server, the caller has to retry it
+    for answer in answers:
+        if isinstance(answer, Exception) and classify_exception(answer) == CheckError.LOCAL:
+            raise answer
+    return None
+
+
+async def detect_probe(session: aiohttp.ClientSession, address: Tuple[str, int], timeout_s: float = 3,
+                       local_retries: int = 3, local_retry_delay_s: float = 1) -> Optional[ProxyType]:
+    while True:
+        try:
+            return await detect_proxy_type(address[0], address[1], timeout_s)
+        except Exception:
+            if not local_retries:
+                raise
+            local_retries -= 1
+            await asyncio.sleep(local_retry_delay_s)
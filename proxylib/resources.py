@@ -1,7 +1,7 @@
 import re
 import aiohttp
 
-from typing import List
+from typing import List, AsyncIterator
 
 from proxylib.types import ProxyType, AnonymityLevel, Proxy, ProxyResouse
 
@@ -24,31 +24,43 @@ class SpysMe(ProxyResouse):
             country: str = "",
             timeout_s: int = 10
     ) -> List[Proxy]:
-        proxies = []
+        return [proxy async for proxy in cls.iterate(session, max_count, min_anonymity_level, types, country,
+                                                     timeout_s)]
+
+    @classmethod
+    async def iterate(
+            cls,
+            session: aiohttp.ClientSession,
+            max_count: int = 200,
+            min_anonymity_level: AnonymityLevel = AnonymityLevel.NONE,
+            types=[t for t in ProxyType],
+            country: str = "",
+            timeout_s: int = 10
+    ) -> AsyncIterator[Proxy]:
+        count = 0
         async with session.get(cls.url, timeout=timeout_s) as response:
-            text = await response.text()
-        results = re.findall(cls.proxy_pattern, text)
-        for result in results:
-            type_ = ProxyType.HTTPS if result[4] == 'S' else ProxyType.HTTP
-            level = AnonymityLevel.UNKNOWN
-            if result[3] == 'H':
-                level = AnonymityLevel.HIGH
-            elif result[3] == 'A':
-                level = AnonymityLevel.MEDIUM
-            elif result[3] == 'N':
-                level = AnonymityLevel.NONE
-            if level.value < min_anonymity_level.value \
-                    or country not in result[2] \
-                    or type_ not in types \
-                    or len(proxies) >= max_count:
-                continue
-            proxy = Proxy(
-                result[0],
-                int(result[1]),
-                type_,
-                country=result[2],
-                anonymity=level,
-                source='spys.me'
-            )
-            proxies.append(proxy)
-        return proxies
+            async for line in response.content:
+                for result in cls.proxy_pattern.finditer(line.decode("utf-8", "replace")):
+                    type_ = ProxyType.HTTPS if result[5] == 'S' else ProxyType.HTTP
+                    level = AnonymityLevel.UNKNOWN
+                    if result[4] == 'H':
+                        level = AnonymityLevel.HIGH
+                    elif result[4] == 'A':
+                        level = AnonymityLevel.MEDIUM
+                    elif result[4] == 'N':
+                        level = AnonymityLevel.NONE
+                    if level.value < min_anonymity_level.value \
+                            or country not in result[3] \
+                            or type_ not in types:
+                        continue
+                    yield Proxy(
+                        result[1],
+                        int(result[2]),
+                        type_,
+                        country=result[3],
+                        anonymity=level,
+                        source='spys.me'
+                    )
+                    count += 1
+                    if count >= max_count:
+                        return
@@ -0,0 +1,205 @@
+import time
+import heapq
+import itertools
+
+from threading import RLock
+from typing import List, Dict, Set, Tuple, Optional, Collection
+
+import aiohttp
+
+from aiohttp import web
+from aiosocksy.errors import InvalidServerReply, InvalidServerVersion, NoAcceptableAuthMethods, \
+    LoginAuthenticationFailed
+
+from proxylib.types import Proxy, ProxyStatus
+from proxylib.utils import ProxyContainer, ProxyContainerListener
+
+hop_by_hop_headers = ("connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "proxy-connection",
+                      "te", "trailer", "transfer-encoding", "upgrade")
+# Failures that are the upstream's own fault, anything else may be caused by the requested target
+proxy_side_errors = (aiohttp.ClientProxyConnectionError, aiohttp.ClientHttpProxyError, InvalidServerReply,
+                     InvalidServerVersion, NoAcceptableAuthMethods, LoginAuthenticationFailed)
+
+
+class RotationStats:
+    __slots__ = ("latency_s", "successes", "attempts", "in_flight", "consecutive_failures")
+
+    def __init__(self, latency_s: float):
+        self.latency_s = latency_s
+        self.successes = 0
+        self.attempts = 0
+        self.in_flight = 0
+        self.consecutive_failures = 0
+
+    @property
+    def success_ratio(self) -> float:
+        return (self.successes + 1) / (self.attempts + 1)
+
+    @property
+    def score(self) -> float:
+        return self.latency_s * (1 + self.in_flight) / self.success_ratio
+
+
+class ProxyRotator(ProxyContainerListener):
+    def __init__(self, container: ProxyContainer, ewma_alpha: float = 0.3, default_latency_s: float = 5.0,
+                 failure_status: ProxyStatus = ProxyStatus.ERROR, max_consecutive_failures: int = 3):
+        self.container = container
+        self.ewma_alpha = ewma_alpha
+        self.default_latency_s = default_latency_s
+        self.failure_status = failure_status
+        self.max_consecutive_failures = max_consecutive_failures
+        self.stats: Dict[Proxy, RotationStats] = {}
+        self._heap: List[Tuple[float, int, Proxy]] = []
+        self._versions: Dict[Proxy, int] = {}
+        self._counter = itertools.count()
+        self._lock = RLock()
+        self.on_added(container.get_all_with_status([ProxyStatus.GOOD]))
+        container.add_listener(self)
+
+    def __len__(self) -> int:
+        return len(self._versions)
+
+    def _push(self, proxy: Proxy) -> None:
+        version = next(self._counter)
+        self._versions[proxy] = version
+        heapq.heappush(self._heap, (self.stats[proxy].score, version, proxy))
+
+    def _add(self, proxy: Proxy) -> None:
+        with self._lock:
+            if proxy not in self.stats:
+                latency_s = (proxy.latency_stats or {}).get("ewma") or proxy.runtime_data.get("checking_elapsed")
+                self.stats[proxy] = RotationStats(latency_s or self.default_latency_s)
+            self._push(proxy)
+
+    def _discard(self, proxy: Proxy) -> None:
+        with self._lock:
+            self._versions.pop(proxy, None)
+            if len(self._heap) > 2 * len(self._versions) + 64:
+                self._heap = [entry for entry in self._heap if self._versions.get(entry[2]) == entry[1]]
+                heapq.heapify(self._heap)
+
+    def on_added(self, proxies: List[Proxy]) -> None:
+        for proxy in proxies:
+            if proxy.status == ProxyStatus.GOOD:
+                self._add(proxy)
+
+    def on_removed(self, proxies: List[Proxy]) -> None:
+        for proxy in proxies:
+            self._discard(proxy)
+            self.stats.pop(proxy, None)
+
+    def on_status_changed(self, proxy: Proxy, old_status: ProxyStatus) -> None:
+        if proxy.status == ProxyStatus.GOOD:
+            self._add(proxy)
+        else:
+            self._discard(proxy)
+
+    def acquire(self, exclude: Collection[Proxy] = ()) -> Optional[Proxy]:
+        with self._lock:
+            skipped = []
+            try:
+                while self._heap:
+                    entry = heapq.heappop(self._heap)
+                    score, version, proxy = entry
+                    if self._versions.get(proxy) != version:
+                        continue
+                    if proxy in exclude:
+                        skipped.append(entry)
+                        continue
+                    self.stats[proxy].in_flight += 1
+                    self._push(proxy)
+                    return proxy
+                return None
+            finally:
+                for entry in skipped:
+                    heapq.heappush(self._heap, entry)
+
+    def release(self, proxy: Proxy, ok: bool, latency_s: Optional[float] = None, proxy_error: bool = True,
+                count_failure: bool = True) -> None:
+        with self._lock:
+            stats = self.stats.get(proxy)
+            if stats is None:
+                return
+            stats.in_flight = max(0, stats.in_flight - 1)
+            if ok or proxy_error or count_failure:
+                stats.attempts += 1
+            if ok:
+                stats.successes += 1
+                stats.consecutive_failures = 0
+                if latency_s is not None:
+                    stats.latency_s += self.ewma_alpha * (latency_s - stats.latency_s)
+            elif proxy_error or count_failure:
+                stats.consecutive_failures += 1
+            demote = not ok and (proxy_error or stats.consecutive_failures >= self.max_consecutive_failures)
+            if proxy in self._versions:
+                self._push(proxy)
+        if demote:
+            proxy.status = self.failure_status
+
+    def close(self) -> None:
+        if self in self.container.listeners:
+            self.container.listeners.remove(self)
+
+
+@web.middleware
+async def absolute_form_middleware(request: web.Request, handler) -> web.StreamResponse:
+    if request.method == "CONNECT" or not request.raw_path.startswith("http://"):
+        return web.Response(status=501, text="Only plain http requests in absolute form are supported")
+    sockname = request.transport.get_extra_info("sockname") if request.transport is not None else None
+    if sockname is not None and (request.url.host, request.url.port) == tuple(sockname[:2]):
+        return web.Response(status=508, text="Request loops back to the rotating proxy")
+    return await handler(request)
+
+
+async def rotating_proxy_handler(request: web.Request) -> web.Response:
+    rotator: ProxyRotator = request.app["rotator"]
+    session: aiohttp.ClientSession = request.app["session"]
+    headers = {key: value for key, value in request.headers.items() if key.lower() not in hop_by_hop_headers}
+    body = await request.read()
+    tried: Set[Proxy] = set()
+    target_side_failures = 0
+    for _ in range(request.app["max_attempts"]):
+        proxy = rotator.acquire(tried)
+        if proxy is None:
+            if tried:
+                break
+            return web.Response(status=503, text="No good proxies")
+        tried.add(proxy)
+        started = time.monotonic()
+        try:
+            async with session.request(request.method, request.url, headers=headers, data=body,
+                                       proxy=proxy.proxy_string.replace("https", "http"),
+                                       timeout=request.app["timeout_s"], allow_redirects=False) as response:
+                payload = await response.read()
+        except Exception as e:
+            proxy_error = isinstance(e, proxy_side_errors)
+            # A failing target fails every upstream, count such failures against one upstream per request only
+            rotator.release(proxy, False, proxy_error=proxy_error, count_failure=not target_side_failures)
+            target_side_failures += not proxy_error
+            continue
+        rotator.release(proxy, True, time.monotonic() - started)
+        response_headers = {key: value for key, value in response.headers.items()
+                            if key.lower() not in hop_by_hop_headers + ("content-length", "content-encoding")}
+        response_headers["X-Proxytool-Upstream"] = "{0}:{1}".format(proxy.host, proxy.port)
+        return web.Response(status=response.status, headers=response_headers, body=payload)
+    return web.Response(status=502, text="All upstream attempts failed")
+
+
+def create_rotating_proxy_app(rotator: ProxyRotator, session: aiohttp.ClientSession, max_attempts: int = 3,
+                              timeout_s: float = 15) -> web.Application:
+    app = web.Application(middlewares=[absolute_form_middleware])
+    app["rotator"] = rotator
+    app["session"] = session
+    app["max_attempts"] = max_attempts
+    app["timeout_s"] = timeout_s
+    app.router.add_route("*", "/{tail:.*}", rotating_proxy_handler)
+    return app
+
+
+async def start_rotating_proxy_server(rotator: ProxyRotator, session: aiohttp.ClientSession,
+                                      host: str = "127.0.0.1", port: int = 8898, max_attempts: int = 3,
+                                      timeout_s: float = 15) -> web.AppRunner:
+    runner = web.AppRunner(create_rotating_proxy_app(rotator, session, max_attempts, timeout_s), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,136 @@
+import time
+import heapq
+import asyncio
+import itertools
+import concurrent.futures
+
+from threading import RLock
+from typing import List, Dict, Tuple, Set, Callable, Optional, Any, AsyncIterator
+
+import aiohttp
+
+from proxylib.types import Proxy, ProxyStatus
+from proxylib.utils import ProxyContainer, ProxyContainerListener, EventLoopThread
+
+
+class RecheckScheduler(ProxyContainerListener):
+    def __init__(self, container: ProxyContainer, checks_per_second: float = 10.0,
+                 intervals_s: Optional[Dict[ProxyStatus, float]] = None, max_backoff_factor: float = 4.0,
+                 min_interval_s: float = 1.0, idle_poll_s: float = 1.0):
+        self.container = container
+        self.checks_per_second = checks_per_second
+        self.intervals_s = intervals_s or container.check_ttl_s
+        self.max_backoff_factor = max_backoff_factor
+        self.min_interval_s = min_interval_s
+        self.idle_poll_s = idle_poll_s
+        self.stopped = False
+        self._heap: List[Tuple[float, int, Proxy]] = []
+        self._versions: Dict[Proxy, int] = {}
+        self._in_flight: Set[Proxy] = set()
+        # Last checked status of every proxy and how many checks in a row returned it
+        self._streaks: Dict[Proxy, Tuple[ProxyStatus, int]] = {}
+        self._counter = itertools.count()
+        self._lock = RLock()
+        self.on_added(container.get_all())
+        container.add_listener(self)
+
+    def __len__(self) -> int:
+        return len(self._versions) + len(self._in_flight)
+
+    def get_interval(self, proxy: Proxy) -> float:
+        status, streak = self._streaks.get(proxy, (proxy.status, 1))
+        if status is not proxy.status:
+            streak = 1
+        return max(self.min_interval_s,
+                   self.intervals_s.get(proxy.status, 0) * min(self.max_backoff_factor, 2 ** (streak - 1)))
+
+    def _schedule(self, proxy: Proxy) -> None:
+        checked_at = proxy.runtime_data.get("checked_at")
+        due_at = 0.0 if checked_at is None else checked_at + self.get_interval(proxy)
+        version = next(self._counter)
+        self._versions[proxy] = version
+        heapq.heappush(self._heap, (due_at, version, proxy))
+
+    def on_added(self, proxies: List[Proxy]) -> None:
+        with self._lock:
+            for proxy in proxies:
+                self._schedule(proxy)
+
+    def on_removed(self, proxies: List[Proxy]) -> None:
+        with self._lock:
+            for proxy in proxies:
+                self._versions.pop(proxy, None)
+                self._in_flight.discard(proxy)
+                self._streaks.pop(proxy, None)
+            if len(self._heap) > 2 * len(self._versions) + 64:
+                self._heap = [entry for entry in self._heap if self._versions.get(entry[2]) == entry[1]]
+                heapq.heapify(self._heap)
+
+    def pop_due(self, now: Optional[float] = None) -> Optional[Proxy]:
+        now = time.time() if now is None else now
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due_at, version, proxy = heapq.heappop(self._heap)
+                if self._versions.get(proxy) == version:
+                    del self._versions[proxy]
+                    self._in_flight.add(proxy)
+                    return proxy
+            return None
+
+    def next_due_in(self, now: Optional[float] = None) -> float:
+        now = time.time() if now is None else now
+        with self._lock:
+            while self._heap and self._versions.get(self._heap[0][2]) != self._heap[0][1]:
+                heapq.heappop(self._heap)
+            return max(0.0, self._heap[0][0] - now) if self._heap else self.idle_poll_s
+
+    def record_result(self, proxy: Proxy) -> None:
+        with self._lock:
+            if proxy not in self._in_flight:
+                return
+            self._in_flight.discard(proxy)
+            status, streak = self._streaks.get(proxy, (None, 0))
+            self._streaks[proxy] = (proxy.status, streak + 1 if status is proxy.status else 1)
+            if "checked_at" not in proxy.runtime_data:
+                proxy.mark_checked()
+            self._schedule(proxy)
+
+    def stop(self) -> None:
+        self.stopped = True
+
+    def close(self) -> None:
+        self.stop()
+        if self in self.container.listeners:
+            self.container.listeners.remove(self)
+
+
+def scheduled_http_works(background_thread: EventLoopThread, on_start: Callable[[None], None],
+                         on_result: Callable[[Proxy, Any], None], on_end: Callable[[int], None],
+                         scheduler: RecheckScheduler, max_concurrent_workers: int,
+                         worker: Callable[[aiohttp.ClientSession, Proxy, ...], Any], *worker_args,
+                         **worker_kwargs) -> concurrent.futures.Future:
+    loop = background_thread.loop
+
+    async def __due() -> AsyncIterator[Proxy]:
+        next_at = loop.time()
+        while not scheduler.stopped:
+            proxy = scheduler.pop_due()
+            if proxy is None:
+                await asyncio.sleep(min(scheduler.next_due_in(), scheduler.idle_poll_s))
+                continue
+            yield proxy
+            next_at = max(next_at + 1 / scheduler.checks_per_second, loop.time())
+            await asyncio.sleep(next_at - loop.time())
+
+    async def __work():
+        session = await background_thread.get_session()
+        on_start()
+        count = 0
+        async for proxy, result in background_thread.iterate_http_works(session, __due(), max_concurrent_workers,
+                                                                         worker, *worker_args, **worker_kwargs):
+            scheduler.record_result(proxy)
+            on_result(proxy, result)
+            count += 1
+        on_end(count)
+
+    return asyncio.run_coroutine_threadsafe(__work(), loop)
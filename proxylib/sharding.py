@@ -0,0 +1,111 @@
+import queue
+import multiprocessing
+
+from threading import Thread, Event
+from typing import List, Tuple, Callable, Any, Dict, Optional
+
+import aiohttp
+
+from proxylib.types import Proxy, ProxyType, ProxyStatus, AnonymityLevel
+from proxylib.utils import EventLoopThread
+from proxylib.limiter import AdaptiveLimiter
+from proxylib.metrics import default_metrics
+
+ShardElement = Tuple[int, str, int, int, str, str, Optional[Dict]]
+ShardResult = Tuple[int, int, int, Dict]
+# Runtime data the checks accumulate on, a shard returns them updated and the collector replaces them
+shard_runtime_keys = ("latency", "errors")
+
+
+def _run_shard(shard: List[ShardElement], max_concurrent_workers: int,
+               worker: Callable[[aiohttp.ClientSession, Proxy, ...], Any], worker_args: Tuple, worker_kwargs: Dict,
+               results: multiprocessing.Queue, batch_size: int, batch_interval_s: float, max_probe_workers: int,
+               probe_timeout_s: float) -> None:
+    background_thread = EventLoopThread()
+    indexes = {}
+    proxies = []
+    for index, host, port, type_value, login, password, counters in shard:
+        proxy = Proxy(host, port, ProxyType(type_value), user=login, password=password, runtime_data=counters)
+        indexes[id(proxy)] = index
+        proxies.append(proxy)
+    batch: List[ShardResult] = []
+    finished = Event()
+
+    def flush():
+        if batch:
+            results.put(list(batch))
+            batch.clear()
+
+    def on_result(proxy: Proxy, result: Any):
+        batch.append((indexes[id(proxy)], proxy.status.value, proxy.anonymity.value, proxy.runtime_data))
+        if len(batch) >= batch_size:
+            flush()
+
+    if max_probe_workers:
+        background_thread.tiered_http_works(lambda: None, on_result, lambda count: finished.set(), proxies,
+                                            max_probe_workers, probe_timeout_s, max_concurrent_workers, worker,
+                                            *worker_args, **worker_kwargs)
+    else:
+        background_thread.adaptive_http_works(lambda: None, on_result, lambda count: finished.set(), proxies,
+                                              AdaptiveLimiter(max_concurrent_workers), worker, *worker_args,
+                                              **worker_kwargs)
+    # The batch is only touched from the event loop, slow shards get flushed from there as well
+    while not finished.wait(batch_interval_s):
+        background_thread.loop.call_soon_threadsafe(flush)
+    background_thread.close()
+    flush()
+    results.put(None)
+
+
+def sharded_http_works(on_start: Callable[[None], None], on_result: Callable[[Proxy, Any], None],
+                       on_end: Callable[[int], None], elements: List[Proxy], processes: int,
+                       max_concurrent_workers: int, worker: Callable[[aiohttp.ClientSession, Proxy, ...], Any],
+                       *worker_args, batch_size: int = 100, batch_interval_s: float = 0.5, max_probe_workers: int = 0,
+                       probe_timeout_s: float = 3, **worker_kwargs) -> Thread:
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    shards: List[List[ShardElement]] = [[] for _ in range(processes)]
+    for index, proxy in enumerate(elements):
+        shards[index % processes].append(
+            (index, proxy.host, proxy.port, proxy.proxy_type.value, proxy.login, proxy.password,
+             {key: proxy.runtime_data[key] for key in shard_runtime_keys if key in proxy.runtime_data} or None))
+    workers = [context.Process(target=_run_shard, daemon=True,
+                               args=(shard, max_concurrent_workers, worker, worker_args, worker_kwargs, results,
+                                     batch_size, batch_interval_s, max_probe_workers, probe_timeout_s))
+               for shard in shards if shard]
+
+    labels = {"worker": getattr(worker, "__qualname__", str(worker))}
+
+    def __collect():
+        on_start()
+        for process in workers:
+            process.start()
+        count = 0
+        finished_workers = 0
+        while finished_workers < len(workers):
+            try:
+                batch = results.get(timeout=1)
+            except queue.Empty:
+                if not any(process.is_alive() for process in workers):
+                    break
+                continue
+            if batch is None:
+                finished_workers += 1
+                continue
+            for index, status, anonymity, runtime_data in batch:
+                proxy = elements[index]
+                proxy.runtime_data.update(runtime_data)
+                proxy.anonymity = AnonymityLevel(anonymity)
+                proxy.status = ProxyStatus(status)
+                proxy.mark_checked(proxy.runtime_data.get("checked_at"))
+                default_metrics.inc("proxytool_checks_completed_total", labels)
+                default_metrics.inc("proxytool_check_results_total", dict(labels, status=proxy.status.name))
+                on_result(proxy, None)
+                count += 1
+        for process in workers:
+            process.join()
+        on_end(count)
+
+    collector = Thread(target=__collect, daemon=True)
+    collector.start()
+    return collector
@@ -0,0 +1,164 @@
+import json
+import time
+import queue
+import sqlite3
+
+from threading import Thread
+from typing import List, Optional, Tuple, Any
+
+from proxylib.types import Proxy, ProxyStatus, ProxyType, AnonymityLevel
+from proxylib.utils import ProxyContainer, ProxyContainerListener
+
+schema = """
+CREATE TABLE IF NOT EXISTS proxies (
+    proxy_string TEXT PRIMARY KEY,
+    host TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    proxy_type INTEGER NOT NULL,
+    anonymity INTEGER NOT NULL,
+    status INTEGER NOT NULL,
+    country TEXT NOT NULL,
+    source TEXT NOT NULL,
+    login TEXT NOT NULL,
+    password TEXT NOT NULL,
+    last_latency REAL,
+    checked_at REAL,
+    runtime_data TEXT
+);
+CREATE INDEX IF NOT EXISTS proxies_status ON proxies (status);
+CREATE INDEX IF NOT EXISTS proxies_proxy_type ON proxies (proxy_type);
+CREATE INDEX IF NOT EXISTS proxies_country ON proxies (country);
+CREATE INDEX IF NOT EXISTS proxies_last_latency ON proxies (last_latency);
+CREATE TABLE IF NOT EXISTS check_history (
+    id INTEGER PRIMARY KEY,
+    proxy_string TEXT NOT NULL,
+    checked_at REAL NOT NULL,
+    status INTEGER NOT NULL,
+    latency REAL
+);
+CREATE INDEX IF NOT EXISTS check_history_proxy ON check_history (proxy_string, checked_at);
+"""
+
+upsert_proxy_sql = "INSERT OR REPLACE INTO proxies VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+delete_proxy_sql = "DELETE FROM proxies WHERE proxy_string = ?"
+insert_history_sql = "INSERT INTO check_history (proxy_string, checked_at, status, latency) VALUES (?, ?, ?, ?)"
+
+
+class SqliteProxyStore(ProxyContainerListener):
+    def __init__(self, path: str, batch_size: int = 1000, flush_interval_s: float = 1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self._queue: queue.Queue = queue.Queue()
+        self._loading = False
+        with self._connect() as connection:
+            connection.executescript(schema)
+        self._writer = Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _write_loop(self) -> None:
+        connection = self._connect()
+        stopping = False
+        while not stopping:
+            batch: List[Optional[Tuple[str, Tuple[Any, ...]]]] = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval_s
+            while len(batch) < self.batch_size and batch[-1] is not None:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            if batch[-1] is None:
+                stopping = True
+                batch.pop()
+            with connection:
+                for statement, parameters in batch:
+                    connection.execute(statement, parameters)
+        connection.close()
+
+    @staticmethod
+    def _proxy_row(proxy: Proxy) -> Tuple[Any, ...]:
+        return (
+            proxy.proxy_string,
+            proxy.host,
+            proxy.port,
+            proxy.proxy_type.value,
+            proxy.anonymity.value,
+            proxy.status.value,
+            proxy.country,
+            proxy.source,
+            proxy.login,
+            proxy.password,
+            proxy.runtime_data.get("checking_elapsed") if proxy.status == ProxyStatus.GOOD else None,
+            proxy.runtime_data.get("checked_at"),
+            json.dumps(proxy.runtime_data, default=str),
+        )
+
+    def on_added(self, proxies: List[Proxy]) -> None:
+        if self._loading:
+            return
+        for proxy in proxies:
+            self._queue.put((upsert_proxy_sql, self._proxy_row(proxy)))
+
+    def on_removed(self, proxies: List[Proxy]) -> None:
+        for proxy in proxies:
+            self._queue.put((delete_proxy_sql, (proxy.proxy_string,)))
+
+    def on_status_changed(self, proxy: Proxy, old_status: ProxyStatus) -> None:
+        if not self._loading:
+            self._queue.put((upsert_proxy_sql, self._proxy_row(proxy)))
+
+    def record_check(self, proxy: Proxy) -> None:
+        row = self._proxy_row(proxy)
+        self._queue.put((upsert_proxy_sql, row))
+        self._queue.put((insert_history_sql, (proxy.proxy_string, row[11] or time.time(), row[5], row[10])))
+
+    def load(self, container: ProxyContainer, status_list: Optional[List[ProxyStatus]] = None,
+             limit: Optional[int] = None, batch_size: int = 10000) -> int:
+        query = "SELECT host, port, proxy_type, anonymity, status, country, source, login, password, runtime_data " \
+                "FROM proxies"
+        parameters: List[Any] = []
+        if status_list:
+            query += " WHERE status IN ({})".format(", ".join("?" * len(status_list)))
+            parameters.extend(status.value for status in status_list)
+        query += " ORDER BY last_latency IS NULL, last_latency"
+        if limit:
+            query += " LIMIT ?"
+            parameters.append(limit)
+        connection = self._connect()
+        self._loading = True
+        try:
+            return container.add_from_iterable((Proxy(
+                host,
+                port,
+                ProxyType(proxy_type),
+                AnonymityLevel(anonymity),
+                ProxyStatus(status),
+                country,
+                source,
+                login,
+                password,
+                json.loads(runtime_data) if runtime_data else None
+            ) for host, port, proxy_type, anonymity, status, country, source, login, password, runtime_data
+                in connection.execute(query, parameters)), batch_size)
+        finally:
+            self._loading = False
+            connection.close()
+
+    def get_history(self, proxy: Proxy, limit: int = 100) -> List[Tuple[float, ProxyStatus, Optional[float]]]:
+        connection = self._connect()
+        try:
+            return [(checked_at, ProxyStatus(status), latency) for checked_at, status, latency in connection.execute(
+                "SELECT checked_at, status, latency FROM check_history WHERE proxy_string = ? "
+                "ORDER BY checked_at DESC LIMIT ?", (proxy.proxy_string, limit))]
+        finally:
+            connection.close()
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._writer.join()
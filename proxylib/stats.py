@@ -0,0 +1,60 @@
+from typing import List, Dict, Iterable, Optional, Any
+
+# Upper bounds of the latency histogram buckets, the last bucket collects everything slower
+latency_buckets_s = (0.05, 0.1, 0.2, 0.35, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 7.5, 10.0, 15.0, 30.0)
+
+
+def new_latency_stats() -> Dict[str, Any]:
+    return {
+        "ewma": None,
+        "min": None,
+        "max": None,
+        "successes": 0,
+        "attempts": 0,
+        "last_failure_elapsed": None,
+        "histogram": [0] * (len(latency_buckets_s) + 1),
+    }
+
+
+def bucket_index(elapsed_s: float) -> int:
+    for index, bound in enumerate(latency_buckets_s):
+        if elapsed_s <= bound:
+            return index
+    return len(latency_buckets_s)
+
+
+def update_latency_stats(stats: Dict[str, Any], elapsed_s: float, ok: bool, ewma_alpha: float = 0.3) -> None:
+    stats["attempts"] += 1
+    if not ok:
+        stats["last_failure_elapsed"] = elapsed_s
+        return
+    stats["successes"] += 1
+    stats["ewma"] = elapsed_s if stats["ewma"] is None else stats["ewma"] + ewma_alpha * (elapsed_s - stats["ewma"])
+    stats["min"] = elapsed_s if stats["min"] is None else min(stats["min"], elapsed_s)
+    stats["max"] = elapsed_s if stats["max"] is None else max(stats["max"], elapsed_s)
+    stats["histogram"][bucket_index(elapsed_s)] += 1
+
+
+def success_ratio(stats: Dict[str, Any]) -> float:
+    return stats["successes"] / stats["attempts"] if stats["attempts"] else 0.0
+
+
+def merge_histograms(histograms: Iterable[List[int]]) -> List[int]:
+    merged = [0] * (len(latency_buckets_s) + 1)
+    for histogram in histograms:
+        for index, count in enumerate(histogram):
+            merged[index] += count
+    return merged
+
+
+def histogram_percentile(histogram: List[int], percentile: float) -> Optional[float]:
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = total * percentile / 100
+    seen = 0
+    for index, count in enumerate(histogram):
+        seen += count
+        if count and seen >= rank:
+            return latency_buckets_s[index] if index < len(latency_buckets_s) else float("inf")
+    return float("inf")
@@ -0,0 +1,258 @@
+import socket
+import struct
+
+from array import array
+from typing import List, Dict, Union, Tuple, Optional, Iterator, Iterable, Callable
+
+from proxylib.types import Proxy, ProxyStatus, ProxyType, AnonymityLevel
+from proxylib.utils import ProxyContainer, ProxyContainerListener
+
+ExoticKey = Tuple[str, int, int, str, str]
+RowKey = Union[int, ExoticKey]
+
+
+class PackedRowIndex:
+    # Open addressing hash table of row numbers, keys are recomputed from the columns instead of being stored
+    def __init__(self, key_of: Callable[[int], int]):
+        self.key_of = key_of
+        self.bits = 3
+        self.slots = array('q', bytes(8 << self.bits))
+        self.count = 0
+
+    def _start(self, key: int) -> int:
+        return ((key * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> (64 - self.bits)
+
+    def _find_slot(self, key: int) -> int:
+        mask = len(self.slots) - 1
+        slot = self._start(key)
+        while self.slots[slot] and self.key_of(self.slots[slot] - 1) != key:
+            slot = (slot + 1) & mask
+        return slot
+
+    def get(self, key: int) -> Optional[int]:
+        row = self.slots[self._find_slot(key)]
+        return row - 1 if row else None
+
+    def add(self, key: int, row: int) -> None:
+        if (self.count + 1) * 2 > len(self.slots):
+            rows = [slot - 1 for slot in self.slots if slot]
+            self.bits += 1
+            self.slots = array('q', bytes(8 << self.bits))
+            for old_row in rows:
+                self.slots[self._find_slot(self.key_of(old_row))] = old_row + 1
+        self.slots[self._find_slot(key)] = row + 1
+        self.count += 1
+
+    def move(self, key: int, row: int) -> None:
+        self.slots[self._find_slot(key)] = row + 1
+
+    def remove(self, key: int) -> None:
+        mask = len(self.slots) - 1
+        hole = self._find_slot(key)
+        slot = hole
+        while True:
+            slot = (slot + 1) & mask
+            row = self.slots[slot]
+            if not row:
+                break
+            start = self._start(self.key_of(row - 1))
+            if (hole < slot and (start <= hole or start > slot)) or (hole > slot and slot < start <= hole):
+                self.slots[hole] = row
+                hole = slot
+        self.slots[hole] = 0
+        self.count -= 1
+
+
+class ColumnarProxyContainer(ProxyContainer):
+    def __init__(self):
+        self.listeners: List[ProxyContainerListener] = []
+        self.ips = array('I')
+        self.ports = array('H')
+        self.types = bytearray()
+        self.statuses = bytearray()
+        self.anonymities = bytearray()
+        self.countries = array('H')
+        self.sources = array('H')
+        self.columns = (self.ips, self.ports, self.types, self.statuses, self.anonymities, self.countries,
+                        self.sources)
+        self.index = PackedRowIndex(self._packed_key)
+        # Rows with a hostname, credentials or an out of range port keep their full identity in a tuple key
+        self.exotic_keys: Dict[int, ExoticKey] = {}
+        self.exotic_index: Dict[ExoticKey, int] = {}
+        self.runtime_data: Dict[RowKey, Dict] = {}
+        self.strings: List[str] = [""]
+        self.string_codes: Dict[str, int] = {"": 0}
+        self.status_counts: List[int] = [0] * len(ProxyStatus)
+
+    def __len__(self) -> int:
+        return len(self.statuses)
+
+    def __contains__(self, proxy: Proxy) -> bool:
+        return self._find_row(self._key(proxy)) is not None
+
+    @staticmethod
+    def _pack_ip(host: str) -> Optional[int]:
+        try:
+            packed = socket.inet_aton(host)
+        except OSError:
+            return None
+        if socket.inet_ntoa(packed) != host:
+            return None
+        return struct.unpack('!I', packed)[0]
+
+    def _key(self, proxy: Proxy) -> RowKey:
+        ip = self._pack_ip(proxy.host)
+        if ip is None or proxy.login or proxy.password or not 0 <= proxy.port <= 0xFFFF:
+            return proxy.host, proxy.port, proxy.proxy_type.value, proxy.login, proxy.password
+        return (ip << 18) | (proxy.port << 2) | proxy.proxy_type.value
+
+    def _packed_key(self, row: int) -> int:
+        return (self.ips[row] << 18) | (self.ports[row] << 2) | self.types[row]
+
+    def _row_key(self, row: int) -> RowKey:
+        key = self.exotic_keys.get(row)
+        return self._packed_key(row) if key is None else key
+
+    def _find_row(self, key: RowKey) -> Optional[int]:
+        if isinstance(key, tuple):
+            return self.exotic_index.get(key)
+        return self.index.get(key)
+
+    def _intern(self, string: str) -> int:
+        code = self.string_codes.get(string)
+        if code is None:
+            code = self.string_codes[string] = len(self.strings)
+            self.strings.append(string)
+        return code
+
+    def _materialize(self, row: int) -> Proxy:
+        key = self._row_key(row)
+        if isinstance(key, tuple):
+            host, port, type_value, login, password = key
+        else:
+            host = socket.inet_ntoa(struct.pack('!I', self.ips[row]))
+            port, type_value, login, password = self.ports[row], self.types[row], "", ""
+        proxy = Proxy(
+            host,
+            port,
+            ProxyType(type_value),
+            AnonymityLevel(self.anonymities[row]),
+            ProxyStatus(self.statuses[row]),
+            self.strings[self.countries[row]],
+            self.strings[self.sources[row]],
+            login,
+            password,
+            self.runtime_data.get(key)
+        )
+        proxy.on_status_changed = self._on_status_changed
+        proxy.on_checked = self._on_checked
+        return proxy
+
+    @staticmethod
+    def _find_rows(column: bytearray, values: Iterable[int]) -> Iterator[int]:
+        for value in set(values):
+            row = column.find(value)
+            while row != -1:
+                yield row
+                row = column.find(value, row + 1)
+
+    def _on_status_changed(self, proxy: Proxy, old_status: ProxyStatus) -> None:
+        key = self._key(proxy)
+        row = self._find_row(key)
+        if row is None:
+            return
+        self.status_counts[self.statuses[row]] -= 1
+        self.status_counts[proxy.status.value] += 1
+        self.statuses[row] = proxy.status.value
+        self.anonymities[row] = proxy.anonymity.value
+        for listener in self.listeners:
+            listener.on_status_changed(proxy, old_status)
+
+    def _on_checked(self, proxy: Proxy) -> None:
+        key = self._key(proxy)
+        row = self._find_row(key)
+        if row is None:
+            return
+        self.anonymities[row] = proxy.anonymity.value
+        # Only checked rows keep a runtime data dict, a materialized copy of any other row gets a fresh one
+        if proxy.runtime_data:
+            self.runtime_data[key] = proxy.runtime_data
+
+    def get_count_all_by_status(self) -> List[int]:
+        return list(self.status_counts)
+
+    def get_all(self) -> List[Proxy]:
+        return [self._materialize(row) for row in range(len(self))]
+
+    def get_all_with_status(self, status_list: List[int]) -> List[Proxy]:
+        return [self._materialize(row) for row in self._find_rows(self.statuses, (s.value for s in status_list))]
+
+    def get_all_with_type(self, type_list: List[ProxyType]) -> List[Proxy]:
+        return [self._materialize(row) for row in self._find_rows(self.types, (t.value for t in type_list))]
+
+    def add_new_list(self, new_list: List[Proxy]) -> int:
+        added_list = []
+        for proxy in new_list:
+            key = self._key(proxy)
+            if self._find_row(key) is not None:
+                continue
+            row = len(self)
+            exotic = isinstance(key, tuple)
+            self.ips.append(0 if exotic else key >> 18)
+            self.ports.append(0 if exotic else proxy.port)
+            self.types.append(proxy.proxy_type.value)
+            self.statuses.append(proxy.status.value)
+            self.anonymities.append(proxy.anonymity.value)
+            self.countries.append(self._intern(proxy.country))
+            self.sources.append(self._intern(proxy.source))
+            if exotic:
+                self.exotic_keys[row] = key
+                self.exotic_index[key] = row
+            else:
+                self.index.add(key, row)
+            if proxy.runtime_data:
+                self.runtime_data[key] = proxy.runtime_data
+            self.status_counts[proxy.status.value] += 1
+            proxy.on_status_changed = self._on_status_changed
+            proxy.on_checked = self._on_checked
+            added_list.append(proxy)
+        if added_list:
+            for listener in self.listeners:
+                listener.on_added(added_list)
+        return len(added_list)
+
+    def _delete_row(self, row: int) -> None:
+        last = len(self) - 1
+        key = self._row_key(row)
+        if isinstance(key, tuple):
+            del self.exotic_keys[row]
+            del self.exotic_index[key]
+        else:
+            self.index.remove(key)
+        self.runtime_data.pop(key, None)
+        self.status_counts[self.statuses[row]] -= 1
+        if row != last:
+            last_key = self._row_key(last)
+            if isinstance(last_key, tuple):
+                del self.exotic_keys[last]
+                self.exotic_keys[row] = last_key
+                self.exotic_index[last_key] = row
+            else:
+                self.index.move(last_key, row)
+            for column in self.columns:
+                column[row] = column[last]
+        for column in self.columns:
+            column.pop()
+
+    def delete_all_with_status(self, status_list: List[int]) -> int:
+        rows = sorted(self._find_rows(self.statuses, (s.value for s in status_list)), reverse=True)
+        delete_list = [self._materialize(row) for row in rows] if self.listeners else []
+        for row in rows:
+            self._delete_row(row)
+        for proxy in delete_list:
+            proxy.on_status_changed = None
+            proxy.on_checked = None
+        if delete_list:
+            for listener in self.listeners:
+                listener.on_removed(delete_list)
+        return len(rows)
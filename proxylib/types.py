@@ -1,9 +1,12 @@
+import time
 import aiohttp
 
 from abc import ABC, abstractmethod
-from typing import List, Dict
+from typing import List, Dict, Optional, Callable, Iterable, AsyncIterator, Any
 from enum import Enum
 
+from proxylib.stats import new_latency_stats, update_latency_stats
+
 
 class ProxyStatus(Enum):
     UNKNOWN = 0
@@ -21,6 +24,17 @@ class AnonymityLevel(Enum):
     HIGH = 4
 
 
+class CheckError(Enum):
+    TIMEOUT = 0
+    REFUSED = 1
+    RESET = 2
+    SOCKS_HANDSHAKE = 3
+    HTTP_STATUS = 4
+    PATTERN_MISMATCH = 5
+    LOCAL = 6
+    OTHER = 7
+
+
 class ProxyType(Enum):
     HTTP = 0
     HTTPS = 1
@@ -29,7 +43,7 @@ class ProxyType(Enum):
 
 
 class Proxy:
-    __slots__ = (
+    fields = (
         'host',
         'port',
         'proxy_type',
@@ -42,6 +56,8 @@ class Proxy:
         'proxy_string',
         'runtime_data',
     )
+    __slots__ = tuple(field for field in fields if field != 'status') + ('_status', 'on_status_changed', 'on_checked')
+    max_error_message_length = 200
 
     def __init__(self,
                  host: str,
@@ -63,21 +79,64 @@ class Proxy:
         self.proxy_type = proxy_type
         self.country = country
         self.source = source
-        self.status = status
-        self.runtime_data = runtime_data or dict()
+        self._status = status
+        self.on_status_changed: Optional[Callable[['Proxy', ProxyStatus], None]] = None
+        self.on_checked: Optional[Callable[['Proxy'], None]] = None
+        self.runtime_data = runtime_data if runtime_data is not None else dict()
         self.proxy_string = "{0}://{1}:{2}@{3}:{4}".format(
             proxy_type.name.lower(), user, password, host, port
         )
 
+    @property
+    def status(self) -> ProxyStatus:
+        return self._status
+
+    @status.setter
+    def status(self, status: ProxyStatus) -> None:
+        old_status = self._status
+        self._status = status
+        if old_status is not status and self.on_status_changed is not None:
+            self.on_status_changed(self, old_status)
+
     def __eq__(self, other):
         return self.proxy_string == other.proxy_string
 
     def __hash__(self):
         return hash(self.proxy_string)
 
-    def to_dict(self) -> Dict[str, str]:
+    def mark_checked(self, checked_at: Optional[float] = None) -> None:
+        self.runtime_data["checked_at"] = time.time() if checked_at is None else checked_at
+        if self.on_checked is not None:
+            self.on_checked(self)
+
+    def record_latency(self, elapsed_s: float, ok: bool) -> None:
+        if "latency" not in self.runtime_data:
+            self.runtime_data["latency"] = new_latency_stats()
+        update_latency_stats(self.runtime_data["latency"], elapsed_s, ok)
+        if ok:
+            self.runtime_data["checking_elapsed"] = round(elapsed_s, 3)
+
+    @property
+    def latency_stats(self) -> Optional[Dict]:
+        return self.runtime_data.get("latency")
+
+    def record_error(self, error: CheckError, message: str = "") -> None:
+        if "errors" not in self.runtime_data:
+            self.runtime_data["errors"] = {}
+        errors = self.runtime_data["errors"]
+        errors[error.name] = errors.get(error.name, 0) + 1
+        self.runtime_data["last_error"] = "{0}: {1}".format(error.name, message[:self.max_error_message_length])
+
+    def get_error_count(self, error: CheckError) -> int:
+        return self.runtime_data.get("errors", {}).get(error.name, 0)
+
+    def is_fresh(self, ttl_s: float, now: Optional[float] = None) -> bool:
+        checked_at = self.runtime_data.get("checked_at")
+        return checked_at is not None and (time.time() if now is None else now) - checked_at < ttl_s
+
+    def to_dict(self, fields: Iterable[str] = None) -> Dict[str, str]:
         dict_ = {}
-        for key in self.__slots__:
+        for key in fields or self.fields:
             this = getattr(self, key, None)
             if isinstance(this, Enum):
                 dict_[key] = this.name
@@ -105,6 +164,19 @@ class ProxyResouse(ABC):
     ) -> List[Proxy]:
         pass
 
+    @classmethod
+    async def iterate(
+            cls,
+            session: aiohttp.ClientSession,
+            max_count: int = 200,
+            min_anonymity_level: AnonymityLevel = AnonymityLevel.NONE,
+            types=[t for t in ProxyType],
+            country: str = '',
+            timeout_s: int = 10
+    ) -> AsyncIterator[Proxy]:
+        for proxy in await cls.parse(session, max_count, min_anonymity_level, types, country, timeout_s):
+            yield proxy
+
 
 class ProxyChecker(ABC):
     @classmethod
@@ -112,6 +184,10 @@ class ProxyChecker(ABC):
     def description(cls) -> str:
         pass
 
+    @classmethod
+    async def prepare(cls, session: aiohttp.ClientSession, **checking_kwargs) -> Dict[str, Any]:
+        return {}
+
     @classmethod
     @abstractmethod
     async def check(
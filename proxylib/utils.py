@@ -1,144 +1,543 @@
+import io
+import sys
+import time
 import json
 import re
 import math
+import heapq
 import asyncio
 import aiohttp
+import functools
+import itertools
 
 from threading import Thread
-from typing import List, Set, Callable, Any, Union
+from typing import (List, Dict, Set, Callable, Any, Union, Iterable, Iterator, AsyncIterable, AsyncIterator, Tuple,
+                    Optional, TextIO, Type)
 
 from aiosocksy.connector import ProxyConnector, ProxyClientRequest
 
-from proxylib.types import ProxyStatus, Proxy, ProxyType, AnonymityLevel
+from proxylib.types import ProxyStatus, Proxy, ProxyType, AnonymityLevel, ProxyResouse, CheckError
+from proxylib.probes import tcp_probe, detect_probe, detect_sockets_per_address
+from proxylib.limiter import AdaptiveLimiter, get_nofile_limit
+from proxylib.stats import merge_histograms, histogram_percentile, success_ratio
+from proxylib.metrics import Metrics, default_metrics, current_metrics, measure_event_loop_lag
+from proxylib.errors import count_exception
+
+
+class ProxyContainerListener:
+    def on_added(self, proxies: List[Proxy]) -> None:
+        pass
+
+    def on_removed(self, proxies: List[Proxy]) -> None:
+        pass
+
+    def on_status_changed(self, proxy: Proxy, old_status: ProxyStatus) -> None:
+        pass
 
 
 class ProxyContainer:
     proxy_pattern: re.Pattern = re.compile("(\d+.\d+.\d+.\d+):(\d+).?(\w?\w?\w?\w?\w?\w?)")
+    export_fields = tuple(field for field in Proxy.fields if field != 'runtime_data')
+    check_ttl_s: Dict[ProxyStatus, float] = {
+        ProxyStatus.UNKNOWN: 0,
+        ProxyStatus.ERROR: 15 * 60,
+        ProxyStatus.BAD: 60 * 60,
+        ProxyStatus.BANNED: 60 * 60,
+        ProxyStatus.GOOD: 5 * 60,
+    }
 
     def __init__(self):
         self.proxy_list: Set[Proxy] = set()
+        self.status_index: List[Set[Proxy]] = [set() for _ in ProxyStatus]
+        self.listeners: List[ProxyContainerListener] = []
+
+    def __len__(self) -> int:
+        return len(self.proxy_list)
+
+    def __contains__(self, proxy: Proxy) -> bool:
+        return proxy in self.proxy_list
+
+    def add_listener(self, listener: ProxyContainerListener) -> None:
+        self.listeners.append(listener)
 
     def get_status(self) -> str:
         statuses_list = self.get_count_all_by_status()
         return "All: {0}  Working: {1}({2}%)  Bad: {3}  Banned: {4}  Error: {5}  Unknown: {6}  Ready: 0".format(
-            len(self.proxy_list),
+            len(self),
             statuses_list[ProxyStatus.GOOD.value],
-            math.floor(statuses_list[ProxyStatus.GOOD.value] / len(self.proxy_list) * 100) if self.proxy_list else 0,
+            math.floor(statuses_list[ProxyStatus.GOOD.value] / len(self) * 100) if len(self) else 0,
             statuses_list[ProxyStatus.BAD.value],
             statuses_list[ProxyStatus.BANNED.value],
             statuses_list[ProxyStatus.ERROR.value],
             statuses_list[ProxyStatus.UNKNOWN.value])
 
     def get_count_all_by_status(self) -> List[int]:
-        statuses_count = [0] * len(ProxyStatus)
-        for proxy in self.proxy_list:
-            statuses_count[proxy.status.value] += 1
-        return statuses_count
+        return [len(bucket) for bucket in self.status_index]
+
+    def get_all(self) -> List[Proxy]:
+        return list(self.proxy_list)
 
     def get_all_with_status(self, status_list: List[int]) -> List[Proxy]:
         result_list = []
-        for proxy in self.proxy_list:
-            if proxy.status in status_list:
-                result_list.append(proxy)
+        for status in set(status_list):
+            result_list.extend(list(self.status_index[status.value]))
         return result_list
 
+    def get_stale_with_status(self, status_list: List[int],
+                              ttl_s: Optional[Dict[ProxyStatus, float]] = None) -> List[Proxy]:
+        ttl_s = ttl_s or self.check_ttl_s
+        now = time.time()
+        return [proxy for proxy in self.get_all_with_status(status_list)
+                if not proxy.is_fresh(ttl_s.get(proxy.status, 0), now)]
+
+    def get_fastest(self, count: int, status_list: Iterable[ProxyStatus] = (ProxyStatus.GOOD,),
+                    min_success_ratio: float = 0.0) -> List[Proxy]:
+        measured = [proxy for proxy in self.get_all_with_status(list(status_list))
+                    if proxy.latency_stats is not None and proxy.latency_stats["ewma"] is not None
+                    and success_ratio(proxy.latency_stats) >= min_success_ratio]
+        return heapq.nsmallest(count, measured, key=lambda proxy: proxy.latency_stats["ewma"])
+
+    def get_latency_percentiles(self, status_list: Optional[Iterable[ProxyStatus]] = None,
+                                percentiles: Iterable[float] = (50, 90, 99)) -> Dict[float, Optional[float]]:
+        proxies = self.get_all() if status_list is None else self.get_all_with_status(list(status_list))
+        histogram = merge_histograms(proxy.latency_stats["histogram"] for proxy in proxies
+                                     if proxy.latency_stats is not None)
+        return {percentile: histogram_percentile(histogram, percentile) for percentile in percentiles}
+
+    def get_error_counts(self, status_list: Optional[Iterable[ProxyStatus]] = None) -> Dict[CheckError, int]:
+        proxies = self.get_all() if status_list is None else self.get_all_with_status(list(status_list))
+        counts = {error: 0 for error in CheckError}
+        for proxy in proxies:
+            for name, count in proxy.runtime_data.get("errors", {}).items():
+                counts[CheckError[name]] += count
+        return counts
+
+    def _on_status_changed(self, proxy: Proxy, old_status: ProxyStatus) -> None:
+        self.status_index[old_status.value].discard(proxy)
+        self.status_index[proxy.status.value].add(proxy)
+        for listener in self.listeners:
+            listener.on_status_changed(proxy, old_status)
+
     def add_new_list(self, new_list: List[Proxy]) -> int:
-        last_count = len(self.proxy_list)
-        self.proxy_list.update(new_list)
-        return len(self.proxy_list) - last_count
+        added_list = []
+        for proxy in new_list:
+            if proxy not in self.proxy_list:
+                self.proxy_list.add(proxy)
+                self.status_index[proxy.status.value].add(proxy)
+                proxy.on_status_changed = self._on_status_changed
+                added_list.append(proxy)
+        if added_list:
+            for listener in self.listeners:
+                listener.on_added(added_list)
+        return len(added_list)
 
     def delete_all_with_status(self, status_list: List[int]) -> int:
         delete_list = self.get_all_with_status(status_list)
         for d in delete_list:
+            d.on_status_changed = None
+            self.status_index[d.status.value].discard(d)
             self.proxy_list.remove(d)
+        if delete_list:
+            for listener in self.listeners:
+                listener.on_removed(delete_list)
         return len(delete_list)
 
+    @staticmethod
+    def write_chunked(file: TextIO, lines: Iterable[str], batch_size: int = 10000) -> None:
+        batch = []
+        for line in lines:
+            batch.append(line)
+            if len(batch) >= batch_size:
+                file.write("".join(batch))
+                batch = []
+        file.write("".join(batch))
+
+    def write_all_with_status_json(self, file: TextIO, status_list: List[int]) -> None:
+        file.write("[")
+        self.write_chunked(file, ("{0}{1}".format("," if i else "", json.dumps(proxy.to_dict(self.export_fields)))
+                                  for i, proxy in enumerate(self.get_all_with_status(status_list))))
+        file.write("]")
+
+    def write_all_with_status_ndjson(self, file: TextIO, status_list: List[int]) -> None:
+        self.write_chunked(file, (json.dumps(proxy.to_dict(self.export_fields)) + "\n"
+                                  for proxy in self.get_all_with_status(status_list)))
+
+    def write_all_with_status_txt(self, file: TextIO, status_list: List[int]) -> None:
+        self.write_chunked(file, ("{0}:{1} {2}\n".format(proxy.host, proxy.port, proxy.proxy_type.name)
+                                  for proxy in self.get_all_with_status(status_list)))
+
     def dump_all_with_status_json(self, status_list: List[int]) -> str:
-        output_string = "["
-        for proxy in self.get_all_with_status(status_list):
-            proxy_dict = proxy.to_dict()
-            del proxy_dict['runtime_data']
-            output_string += json.dumps(proxy_dict)
-            output_string += ","
-        output_string = output_string[:-1]
-        output_string += "]"
-        return output_string
+        output = io.StringIO()
+        self.write_all_with_status_json(output, status_list)
+        return output.getvalue()
 
     def dump_all_with_status_txt(self, status_list: List[int]) -> str:
-        return "".join(["{0}:{1} {2}\n".format(proxy.host, proxy.port, proxy.proxy_type.name)
-                        for proxy in self.get_all_with_status(status_list)])
+        output = io.StringIO()
+        self.write_all_with_status_txt(output, status_list)
+        return output.getvalue()
 
-    def add_from_txt(self, raw: str, on_missing_type: Callable[[], ProxyType]) -> int:
-        add_list = []
+    @staticmethod
+    def read_lines_chunked(file: TextIO, chunk_size: int = 1 << 20) -> Iterator[str]:
+        carry = ""
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            chunk = carry + chunk
+            end = chunk.rfind("\n") + 1
+            carry = chunk[end:]
+            if end:
+                yield chunk[:end]
+        if carry:
+            yield carry
+
+    def parse_txt(self, chunks: Iterable[str], on_missing_type: Optional[Callable[[], ProxyType]],
+                  on_untyped: Optional[Callable[[str, int], None]] = None) -> Iterator[Proxy]:
         default_type = None
-        results = re.findall(self.proxy_pattern, raw)
-        for result in results:
-            try:
-                this_type = ProxyType[result[2]]
-            except KeyError:
-                if not default_type:
-                    default_type = on_missing_type()
-                this_type = default_type
-            add_list.append(Proxy(result[0], int(result[1]), this_type))
-        return self.add_new_list(add_list)
+        for chunk in chunks:
+            for result in self.proxy_pattern.finditer(chunk):
+                host, port, type_name = result.groups()
+                try:
+                    this_type = ProxyType[type_name]
+                except KeyError:
+                    if on_untyped is not None:
+                        on_untyped(host, int(port))
+                        continue
+                    if not default_type:
+                        default_type = on_missing_type()
+                    this_type = default_type
+                yield Proxy(host, int(port), this_type)
 
-    def add_from_json(self, raw: str) -> int:
-        add_list = []
-        proxies = json.loads(raw)
+    def add_from_iterable(self, proxies: Iterable[Proxy], batch_size: int = 10000,
+                          on_progress: Optional[Callable[[int], None]] = None) -> int:
+        added_count = 0
+        batch = []
         for proxy in proxies:
-            add_list.append(Proxy(
-                proxy['host'],
-                int(proxy['port']),
-                ProxyType[proxy['proxy_type']],
-                AnonymityLevel[proxy['anonymity']],
-                ProxyStatus[proxy['status']],
-                proxy['country'],
-                proxy['source'],
-                proxy['login'],
-                proxy['password']
-            ))
-        return self.add_new_list(add_list)
+            batch.append(proxy)
+            if len(batch) >= batch_size:
+                added_count += self.add_new_list(batch)
+                batch = []
+                if on_progress:
+                    on_progress(added_count)
+        added_count += self.add_new_list(batch)
+        if on_progress:
+            on_progress(added_count)
+        return added_count
+
+    def add_from_txt(self, raw: str, on_missing_type: Optional[Callable[[], ProxyType]],
+                     on_untyped: Optional[Callable[[str, int], None]] = None) -> int:
+        return self.add_from_iterable(self.parse_txt((raw,), on_missing_type, on_untyped))
+
+    def add_from_txt_file(self, file: TextIO, on_missing_type: Optional[Callable[[], ProxyType]],
+                          on_progress: Optional[Callable[[int], None]] = None, chunk_size: int = 1 << 20,
+                          on_untyped: Optional[Callable[[str, int], None]] = None) -> int:
+        return self.add_from_iterable(self.parse_txt(self.read_lines_chunked(file, chunk_size), on_missing_type,
+                                                     on_untyped), on_progress=on_progress)
+
+    @staticmethod
+    def proxy_from_dict(proxy: Dict[str, str]) -> Proxy:
+        return Proxy(
+            proxy['host'],
+            int(proxy['port']),
+            ProxyType[proxy['proxy_type']],
+            AnonymityLevel[proxy['anonymity']],
+            ProxyStatus[proxy['status']],
+            proxy['country'],
+            proxy['source'],
+            proxy['login'],
+            proxy['password']
+        )
+
+    def add_from_json(self, raw: str) -> int:
+        return self.add_new_list([self.proxy_from_dict(proxy) for proxy in json.loads(raw)])
+
+    def add_from_ndjson_file(self, file: TextIO, on_progress: Optional[Callable[[int], None]] = None) -> int:
+        return self.add_from_iterable((self.proxy_from_dict(json.loads(line)) for line in file if line.strip()),
+                                      on_progress=on_progress)
+
+
+event_loop_ids = itertools.count(1)
 
 
 class EventLoopThread:
 
-    def __init__(self):
+    def __init__(self, connector_limit: Optional[int] = None, connector_limit_per_host: int = 0,
+                 dns_cache_ttl_s: int = 300, keepalive_timeout_s: float = 30, metrics: Metrics = default_metrics,
+                 fd_reserve: int = 64):
+        # Without an explicit limit the pool may use every file descriptor except a reserve for files and servers
+        self.connector_limit = connector_limit if connector_limit is not None \
+            else max(1, get_nofile_limit() - fd_reserve)
+        self.connector_limit_per_host = connector_limit_per_host
+        self.dns_cache_ttl_s = dns_cache_ttl_s
+        self.keepalive_timeout_s = keepalive_timeout_s
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.metrics = metrics
+        self.metrics.add_function("proxytool_open_connections", self.get_open_connections_count)
         self.loop = asyncio.new_event_loop()
-        self.t = Thread(target=self.start_background_loop, args=(self.loop,), daemon=True)
+        self.t = Thread(target=self.start_background_loop, args=(self.loop,), daemon=True,
+                        name="proxytool-loop-{}".format(next(event_loop_ids)))
         self.t.start()
+        self.lag_future = asyncio.run_coroutine_threadsafe(
+            measure_event_loop_lag(self.metrics, labels={"loop": self.t.name}), self.loop)
 
     def start_background_loop(self, loop: asyncio.AbstractEventLoop) -> None:
         asyncio.set_event_loop(loop)
         loop.run_forever()
 
-    def multiple_http_works(self, on_start: Callable[[None], None], on_end: Callable[[List[Any]], None],
-                            elements: List[Union[Proxy, Any]], max_concurrent_workers: int,
-                            worker: Callable[[aiohttp.ClientSession, Union[Proxy, Any], ...], Any], *worker_args,
+    async def get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            connector = ProxyConnector(limit=self.connector_limit, limit_per_host=self.connector_limit_per_host,
+                                       ttl_dns_cache=self.dns_cache_ttl_s,
+                                       keepalive_timeout=self.keepalive_timeout_s)
+            self.session = aiohttp.ClientSession(connector=connector, request_class=ProxyClientRequest)
+        return self.session
+
+    def get_open_connections_count(self) -> int:
+        if self.session is None or self.session.closed:
+            return 0
+        connector = self.session.connector
+        return len(getattr(connector, "_acquired", ())) + sum(len(connections) for connections in
+                                                               getattr(connector, "_conns", {}).values())
+
+    def close(self) -> None:
+        self.lag_future.cancel()
+        self.metrics.remove_function("proxytool_open_connections", self.get_open_connections_count)
+
+        async def __close():
+            if self.session is not None:
+                await self.session.close()
+                self.session = None
+
+        if self.loop.is_running():
+            asyncio.run_coroutine_threadsafe(__close(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.t.join()
+        self.metrics.remove("proxytool_event_loop_lag_seconds", {"loop": self.t.name})
+
+    async def iterate_http_works(self, session: aiohttp.ClientSession,
+                                 elements: Union[Iterable[Union[Proxy, Any]], AsyncIterable[Union[Proxy, Any]]],
+                                 max_concurrent_workers: int,
+                                 worker: Callable[[aiohttp.ClientSession, Union[Proxy, Any], ...], Any], *worker_args,
+                                 limiter: Optional[AdaptiveLimiter] = None,
+                                 **worker_kwargs) -> AsyncIterator[Tuple[Union[Proxy, Any], Any]]:
+        done = object()
+        elements_queue = asyncio.Queue(max_concurrent_workers * 2)
+        results_queue = asyncio.Queue(max_concurrent_workers * 2)
+
+        async def __producer():
+            if hasattr(elements, "__aiter__"):
+                async for element in elements:
+                    await elements_queue.put(element)
+            else:
+                for element in elements:
+                    await elements_queue.put(element)
+            for _ in range(max_concurrent_workers):
+                await elements_queue.put(done)
+
+        labels = {"worker": getattr(worker, "__qualname__", str(worker))}
+
+        async def __worker():
+            current_metrics.set(self.metrics)
+            while True:
+                element = await elements_queue.get()
+                if element is done:
+                    break
+                local_errors_before = element.get_error_count(CheckError.LOCAL) if isinstance(element, Proxy) else 0
+                # Waiting for the limiter is queueing, only the check itself is counted as in flight and timed
+                if limiter is not None:
+                    await limiter.acquire()
+                self.metrics.inc("proxytool_checks_started_total", labels)
+                self.metrics.inc("proxytool_checks_in_flight", labels)
+                started = time.monotonic()
+                try:
+                    result = await worker(session, element, *worker_args, **worker_kwargs)
+                except Exception as e:
+                    result = e
+                    count_exception(e, labels["worker"], self.metrics)
+                self.metrics.inc("proxytool_checks_in_flight", labels, -1)
+                if limiter is not None:
+                    await limiter.release(element.get_error_count(CheckError.LOCAL) - local_errors_before
+                                          if isinstance(element, Proxy) else 0)
+                self.metrics.inc("proxytool_checks_completed_total", labels)
+                self.metrics.observe("proxytool_check_duration_seconds", time.monotonic() - started, labels)
+                if isinstance(element, Proxy):
+                    self.metrics.inc("proxytool_check_results_total", dict(labels, status=element.status.name))
+                await results_queue.put((element, result))
+            await results_queue.put(done)
+
+        tasks = [self.loop.create_task(__producer())]
+        tasks.extend(self.loop.create_task(__worker()) for _ in range(max_concurrent_workers))
+        finished_workers = 0
+        try:
+            while finished_workers < max_concurrent_workers:
+                item = await results_queue.get()
+                if item is done:
+                    finished_workers += 1
+                else:
+                    yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def streaming_http_works(self, on_start: Callable[[None], None],
+                             on_result: Callable[[Union[Proxy, Any], Any], None], on_end: Callable[[int], None],
+                             elements: Iterable[Union[Proxy, Any]], max_concurrent_workers: int,
+                             worker: Callable[[aiohttp.ClientSession, Union[Proxy, Any], ...], Any], *worker_args,
+                             limiter: Optional[AdaptiveLimiter] = None, **worker_kwargs) -> None:
+        async def __work():
+            session = await self.get_session()
+            on_start()
+            count = 0
+            async for element, result in self.iterate_http_works(session, elements, max_concurrent_workers, worker,
+                                                                 *worker_args, limiter=limiter, **worker_kwargs):
+                on_result(element, result)
+                count += 1
+            on_end(count)
+
+        asyncio.run_coroutine_threadsafe(__work(), self.loop)
+
+    def adaptive_http_works(self, on_start: Callable[[None], None], on_result: Callable[[Proxy, Any], None],
+                            on_end: Callable[[int], None], elements: Iterable[Proxy], limiter: AdaptiveLimiter,
+                            worker: Callable[[aiohttp.ClientSession, Proxy, ...], Any], *worker_args,
                             **worker_kwargs) -> None:
+        def __on_end(count: int):
+            limiter.close()
+            on_end(count)
+
+        self.streaming_http_works(on_start, on_result, __on_end, elements, limiter.max_limit, worker, *worker_args,
+                                  limiter=limiter, **worker_kwargs)
+
+    def tiered_http_works(self, on_start: Callable[[None], None], on_result: Callable[[Proxy, Any], None],
+                          on_end: Callable[[int], None], elements: Iterable[Proxy], max_probe_workers: int,
+                          probe_timeout_s: float, max_concurrent_workers: int,
+                          worker: Callable[[aiohttp.ClientSession, Proxy, ...], Any], *worker_args,
+                          **worker_kwargs) -> None:
         async def __work():
-            semaphore = asyncio.Semaphore(max_concurrent_workers)
-            session = aiohttp.ClientSession(connector=ProxyConnector(), request_class=ProxyClientRequest)
+            session = await self.get_session()
+            on_start()
+            count = 0
 
-            async def __task(element: Union[Proxy, Any]):
-                async with semaphore:
-                    return await worker(session, element, *worker_args, **worker_kwargs)
+            async def __probed():
+                nonlocal count
+                async for proxy, alive in self.iterate_http_works(session, elements, max_probe_workers, tcp_probe,
+                                                                  timeout_s=probe_timeout_s):
+                    if alive is True:
+                        yield proxy
+                    else:
+                        on_result(proxy, alive)
+                        count += 1
 
+            async for proxy, result in self.iterate_http_works(session, __probed(), max_concurrent_workers, worker,
+                                                               *worker_args, **worker_kwargs):
+                on_result(proxy, result)
+                count += 1
+            on_end(count)
+
+        asyncio.run_coroutine_threadsafe(__work(), self.loop)
+
+    def parse_http_works(self, on_start: Callable[[None], None],
+                         on_result: Callable[[Type[ProxyResouse], Union[List[Proxy], Exception]], None],
+                         on_end: Callable[[int], None], resources: List[Type[ProxyResouse]],
+                         is_known: Callable[[Proxy], bool], max_count: int, batch_size: int = 100,
+                         **parse_kwargs) -> None:
+        async def __work():
+            session = await self.get_session()
             on_start()
-            tasks = [self.loop.create_task(__task(element)) for element in elements]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            await session.close()
-            on_end(results)
+            done = object()
+            results_queue = asyncio.Queue(batch_size)
+
+            async def __producer(resource: Type[ProxyResouse]):
+                try:
+                    # Known and duplicate proxies do not count, so the run is stopped here instead of in the resource
+                    async for proxy in resource.iterate(session, sys.maxsize, **parse_kwargs):
+                        await results_queue.put((resource, proxy))
+                except Exception as e:
+                    await results_queue.put((resource, e))
+                await results_queue.put((resource, done))
+
+            tasks = [self.loop.create_task(__producer(resource)) for resource in resources]
+            batches: Dict[Type[ProxyResouse], List[Proxy]] = {resource: [] for resource in resources}
+            seen: Set[Proxy] = set()
+            finished_resources = 0
+            count = 0
+            try:
+                while finished_resources < len(tasks) and count < max_count:
+                    resource, item = await results_queue.get()
+                    if item is done:
+                        finished_resources += 1
+                    elif isinstance(item, Exception):
+                        on_result(resource, item)
+                    elif item not in seen and not is_known(item):
+                        seen.add(item)
+                        batches[resource].append(item)
+                        count += 1
+                        if len(batches[resource]) >= batch_size:
+                            on_result(resource, batches[resource])
+                            batches[resource] = []
+            finally:
+                for task in tasks:
+                    task.cancel()
+            for resource, batch in batches.items():
+                if batch:
+                    on_result(resource, batch)
+            on_end(count)
 
         asyncio.run_coroutine_threadsafe(__work(), self.loop)
 
+    def detect_http_works(self, on_start: Callable[[None], None], on_result: Callable[[List[Proxy]], None],
+                          on_end: Callable[[int, int], None], addresses: Iterable[Tuple[str, int]],
+                          max_concurrent_workers: int, timeout_s: float = 3, batch_size: int = 100,
+                          fallback_type: Optional[ProxyType] = None, fd_reserve: int = 64) -> None:
+        max_concurrent_workers = max(1, min(max_concurrent_workers,
+                                            (get_nofile_limit() - fd_reserve) // detect_sockets_per_address))
+        batch: List[Proxy] = []
+        detected = [0]
+
+        def __on_result(address: Tuple[str, int], proxy_type: Union[ProxyType, None, Exception]):
+            if isinstance(proxy_type, ProxyType):
+                detected[0] += 1
+            elif fallback_type is not None:
+                proxy_type = fallback_type
+            else:
+                return
+            batch.append(Proxy(address[0], address[1], proxy_type))
+            if len(batch) >= batch_size:
+                on_result(list(batch))
+                batch.clear()
+
+        def __on_end(count: int):
+            if batch:
+                on_result(list(batch))
+                batch.clear()
+            on_end(detected[0], count)
+
+        self.streaming_http_works(on_start, __on_result, __on_end, addresses, max_concurrent_workers, detect_probe,
+                                  timeout_s=timeout_s)
+
+    def multiple_http_works(self, on_start: Callable[[None], None], on_end: Callable[[List[Any]], None],
+                            elements: List[Union[Proxy, Any]], max_concurrent_workers: int,
+                            worker: Callable[[aiohttp.ClientSession, Union[Proxy, Any], ...], Any], *worker_args,
+                            **worker_kwargs) -> None:
+        results = [None] * len(elements)
+
+        def on_result(element: Tuple[int, Union[Proxy, Any]], result: Any):
+            results[element[0]] = result
+
+        @functools.wraps(worker)
+        async def __indexed_worker(session: aiohttp.ClientSession, element: Tuple[int, Union[Proxy, Any]], *args,
+                                   **kwargs):
+            return await worker(session, element[1], *args, **kwargs)
+
+        self.streaming_http_works(on_start, on_result, lambda count: on_end(results), enumerate(elements),
+                                  max_concurrent_workers, __indexed_worker, *worker_args, **worker_kwargs)
+
     def single_http_work(self, on_start: Callable[[None], None], on_end: Callable[[Any], None],
                          worker: Callable[[aiohttp.ClientSession, ...], Any], *worker_args, **worker_kwargs) -> None:
         async def __work():
-            session = aiohttp.ClientSession(connector=ProxyConnector(), request_class=ProxyClientRequest)
+            session = await self.get_session()
             on_start()
             results = await asyncio.gather(self.loop.create_task(worker(session, *worker_args, **worker_kwargs)),
                                            return_exceptions=True)
             on_end(results[0])
-            await session.close()
 
         asyncio.run_coroutine_threadsafe(__work(), self.loop)
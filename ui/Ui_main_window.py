@@ -328,9 +328,59 @@ class Ui_MainWindow(object):
         self.label_9 = QtWidgets.QLabel(self.groupBox_3)
         self.label_9.setGeometry(QtCore.QRect(170, 180, 47, 13))
         self.label_9.setObjectName("label_9")
+        self.tcp_probe_checkbox = QtWidgets.QCheckBox(self.groupBox_3)
+        self.tcp_probe_checkbox.setGeometry(QtCore.QRect(130, 113, 141, 16))
+        self.tcp_probe_checkbox.setObjectName("tcp_probe_checkbox")
         self.checkers_list = QtWidgets.QListWidget(self.groupBox_3)
         self.checkers_list.setGeometry(QtCore.QRect(280, 6, 91, 231))
         self.checkers_list.setObjectName("checkers_list")
+        self.groupBox_4 = QtWidgets.QGroupBox(self.centralWidget)
+        self.groupBox_4.setGeometry(QtCore.QRect(660, 10, 301, 241))
+        self.groupBox_4.setAlignment(QtCore.Qt.AlignCenter)
+        self.groupBox_4.setObjectName("groupBox_4")
+        self.label_10 = QtWidgets.QLabel(self.groupBox_4)
+        self.label_10.setGeometry(QtCore.QRect(10, 20, 61, 16))
+        self.label_10.setObjectName("label_10")
+        self.checking_processes_spinbox = QtWidgets.QSpinBox(self.groupBox_4)
+        self.checking_processes_spinbox.setGeometry(QtCore.QRect(80, 18, 61, 21))
+        self.checking_processes_spinbox.setMinimum(1)
+        self.checking_processes_spinbox.setMaximum(64)
+        self.checking_processes_spinbox.setProperty("value", 1)
+        self.checking_processes_spinbox.setObjectName("checking_processes_spinbox")
+        self.force_recheck_checkbox = QtWidgets.QCheckBox(self.groupBox_4)
+        self.force_recheck_checkbox.setGeometry(QtCore.QRect(160, 20, 131, 16))
+        self.force_recheck_checkbox.setObjectName("force_recheck_checkbox")
+        self.label_11 = QtWidgets.QLabel(self.groupBox_4)
+        self.label_11.setGeometry(QtCore.QRect(10, 50, 61, 16))
+        self.label_11.setObjectName("label_11")
+        self.database_edit = QtWidgets.QLineEdit(self.groupBox_4)
+        self.database_edit.setGeometry(QtCore.QRect(80, 48, 131, 20))
+        self.database_edit.setObjectName("database_edit")
+        self.database_button = QtWidgets.QPushButton(self.groupBox_4)
+        self.database_button.setGeometry(QtCore.QRect(220, 47, 71, 23))
+        self.database_button.setObjectName("database_button")
+        self.label_12 = QtWidgets.QLabel(self.groupBox_4)
+        self.label_12.setGeometry(QtCore.QRect(10, 80, 61, 16))
+        self.label_12.setObjectName("label_12")
+        self.metrics_port_spinbox = QtWidgets.QSpinBox(self.groupBox_4)
+        self.metrics_port_spinbox.setGeometry(QtCore.QRect(80, 78, 61, 21))
+        self.metrics_port_spinbox.setMinimum(1)
+        self.metrics_port_spinbox.setMaximum(65535)
+        self.metrics_port_spinbox.setProperty("value", 9464)
+        self.metrics_port_spinbox.setObjectName("metrics_port_spinbox")
+        self.metrics_button = QtWidgets.QPushButton(self.groupBox_4)
+        self.metrics_button.setGeometry(QtCore.QRect(220, 77, 71, 23))
+        self.metrics_button.setObjectName("metrics_button")
+        self.allow_private_judge_checkbox = QtWidgets.QCheckBox(self.groupBox_4)
+        self.allow_private_judge_checkbox.setGeometry(QtCore.QRect(10, 110, 281, 16))
+        self.allow_private_judge_checkbox.setObjectName("allow_private_judge_checkbox")
+        self.label_13 = QtWidgets.QLabel(self.groupBox_4)
+        self.label_13.setGeometry(QtCore.QRect(10, 140, 61, 16))
+        self.label_13.setObjectName("label_13")
+        self.database_limit_spinbox = QtWidgets.QSpinBox(self.groupBox_4)
+        self.database_limit_spinbox.setGeometry(QtCore.QRect(80, 138, 61, 21))
+        self.database_limit_spinbox.setMaximum(10000000)
+        self.database_limit_spinbox.setObjectName("database_limit_spinbox")
         MainWindow.setCentralWidget(self.centralWidget)
 
         self.retranslateUi(MainWindow)
@@ -377,6 +427,17 @@ class Ui_MainWindow(object):
         self.label_5.setText(_translate("MainWindow", "Threads"))
         self.label_8.setText(_translate("MainWindow", "Url"))
         self.label_9.setText(_translate("MainWindow", "Pattern"))
+        self.tcp_probe_checkbox.setText(_translate("MainWindow", "TCP pre-probe"))
+        self.groupBox_4.setTitle(_translate("MainWindow", "Settings"))
+        self.label_10.setText(_translate("MainWindow", "Processes"))
+        self.force_recheck_checkbox.setText(_translate("MainWindow", "Force re-check"))
+        self.label_11.setText(_translate("MainWindow", "Database"))
+        self.database_button.setText(_translate("MainWindow", "Open"))
+        self.label_12.setText(_translate("MainWindow", "Metrics port"))
+        self.metrics_button.setText(_translate("MainWindow", "Serve"))
+        self.allow_private_judge_checkbox.setText(_translate("MainWindow", "Allow loopback/private judge"))
+        self.label_13.setText(_translate("MainWindow", "Load limit"))
+        self.database_limit_spinbox.setSpecialValueText(_translate("MainWindow", "all"))
 
 
 if __name__ == "__main__":
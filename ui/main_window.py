@@ -1,22 +1,28 @@
 # -*- coding: utf-8 -*-
+import time
+import asyncio
+
 from datetime import datetime
-from typing import Union, List, Type
+from typing import Union, List, Dict, Tuple, Type, Optional, Any
 from functools import wraps
 
 from PyQt5 import QtGui, QtWidgets, QtCore
 from PyQt5.QtGui import QTextCursor, QColor
 from PyQt5.QtCore import pyqtSlot, Qt
 from PyQt5.QtWidgets import QMainWindow, QMessageBox, QPushButton
+from aiohttp import web
 
-import proxylib.resources
-import proxylib.checkers
+import proxylib.plugins
 
 from ui.Ui_main_window import Ui_MainWindow
+from ui.proxy_table_model import ProxyTableModel
 from proxylib.utils import EventLoopThread, ProxyContainer
-from proxylib.types import ProxyResouse, ProxyChecker, Proxy, ProxyType, AnonymityLevel, ProxyStatus
-from ui.ui_utils import (get_module_subclasses,
-                         display_messagebox_with_buttons,
-                         get_selected_list_widget_items_for_enum)
+from proxylib.sharding import sharded_http_works
+from proxylib.limiter import AdaptiveLimiter
+from proxylib.sqlite_store import SqliteProxyStore
+from proxylib.metrics import start_metrics_server
+from proxylib.types import ProxyResouse, Proxy, ProxyType, AnonymityLevel, ProxyStatus
+from ui.ui_utils import get_selected_list_widget_items_for_enum
 
 
 def synchronized_ui(method):
@@ -47,6 +53,10 @@ class MainWindow(QMainWindow, Ui_MainWindow):
     colours = {"error": QColor(255, 0, 0), "success": QColor(0, 153, 0), "warn": QColor(0, 0, 255),
                "default": QColor(0, 0, 0)}
     log_time_format = "%Y-%m-%d %H:%M:%S"
+    checking_ui_update_interval_s = 1
+    tcp_probe_timeout_s = 3
+    tcp_probe_concurrency_factor = 10
+    undetected_proxy_type = ProxyType.HTTP
 
     def __init__(self, parent=None):
         super(MainWindow, self).__init__(parent)
@@ -54,23 +64,23 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self.setFixedSize(self.size())
         self.setWindowIcon(QtGui.QIcon('icon.png'))
 
-        self.proxies_table_model = QtGui.QStandardItemModel()
+        self.proxy_container = ProxyContainer()
+        self.proxy_store: Optional[SqliteProxyStore] = None
+        self.proxies_table_model = ProxyTableModel(self.proxy_container)
         self.proxies_table.setModel(self.proxies_table_model)
-        self.proxies_table_model.setHorizontalHeaderLabels(Proxy.__slots__)
 
-        self.proxy_container = ProxyContainer()
         self.background_thread = EventLoopThread()
         self.background_executing_tasks_count: int = 0
-        self.resources: List[Type[ProxyResouse]] = get_module_subclasses(proxylib.resources, ProxyResouse)
-        self.checkers: List[Type[ProxyChecker]] = get_module_subclasses(proxylib.checkers, ProxyChecker)
+        self.metrics_runner: Optional[web.AppRunner] = None
+        self.resources: List[str] = proxylib.plugins.resources.names()
+        self.checkers: List[str] = proxylib.plugins.checkers.names()
 
         self.log_write_line_signal.connect(self.log_write_line, QtCore.Qt.QueuedConnection)
         self.update_ui_signal.connect(self.update_ui, QtCore.Qt.QueuedConnection)
 
         for list_widget, checkboxes in zip(
                 (self.resourses_list, self.checkers_list),
-                ([resource.description() for resource in self.resources],
-                 [checker.description() for checker in self.checkers])):
+                (self.resources, self.checkers)):
             for checkbox in checkboxes:
                 item = QtWidgets.QListWidgetItem()
                 item.setText(checkbox)
@@ -84,14 +94,16 @@ class MainWindow(QMainWindow, Ui_MainWindow):
     @QtCore.pyqtSlot()
     def update_ui(self):
         self.setWindowTitle(self.proxy_container.get_status())
-        self.proxies_table_model.removeRows(0, self.proxies_table_model.rowCount())
-        row = 0
-        for proxy in self.proxy_container.proxy_list:
-            column = 0
-            for value in proxy.to_dict().values():
-                self.proxies_table_model.setItem(row, column, QtGui.QStandardItem(value))
-                column += 1
-            row += 1
+        self.proxies_table_model.refresh()
+
+    def closeEvent(self, event: QtGui.QCloseEvent):
+        if self.metrics_runner is not None:
+            asyncio.run_coroutine_threadsafe(self.metrics_runner.cleanup(), self.background_thread.loop).result()
+            self.metrics_runner = None
+        self.background_thread.close()
+        if self.proxy_store is not None:
+            self.proxy_store.close()
+        super(MainWindow, self).closeEvent(event)
 
     @QtCore.pyqtSlot(str, str, str)
     def log_write_line(self, text: str, colour: str = "default", time_format: str = None):
@@ -125,40 +137,40 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             self.log_write_line("Proxy type not selected", 'error')
             return False
 
+        resources = [proxylib.plugins.resources.load(self.resources[i]) for i in range(self.resourses_list.count())
+                     if self.resourses_list.item(i).checkState() == Qt.Checked]
+        if not resources:
+            self.log_write_line("No sources selected", 'error')
+            return
+        self.log_write_line("Parsing {}...".format(", ".join(resource.description() for resource in resources)))
+
         def on_start():
             self.background_executing_tasks_count += 1
 
-        def on_end(result: Union[Exception, List[Proxy]]):
-            self.background_executing_tasks_count -= 1
-            if type(result) is Exception:
-                self.log_write_line_signal.emit("An exception was thrown: {}".format(result), 'error')
+        def on_result(resource: Type[ProxyResouse], result: Union[Exception, List[Proxy]]):
+            if isinstance(result, Exception):
+                self.log_write_line_signal.emit("{0}: an exception was thrown: {1}".format(resource.description(),
+                                                                                           result), 'error')
                 return
-            self.log_write_line_signal.emit("{} results".format(len(result)),
-                                            'success' if len(result) > 0 else 'error')
-            added_count = self.proxy_container.add_new_list(result)
-            self.log_write_line_signal.emit("{} new proxies added".format(added_count),
-                                            'success' if added_count > 0 else 'warn')
+            self.proxy_container.add_new_list(result)
             self.update_ui_signal.emit()
 
-        started_works = 0
-        for i in range(self.resourses_list.count()):
-            if self.resourses_list.item(i).checkState() == Qt.Checked:
-                self.log_write_line("Parsing {}...".format(self.resourses_list.item(i).text()))
-                self.background_thread.single_http_work(on_start, on_end, self.resources[i].parse,
-                                                        max_count=self.max_count_spinbox.value(),
-                                                        min_anonymity_level=AnonymityLevel(
-                                                            self.anonymity_combobox.currentIndex()),
-                                                        types=selected_types,
-                                                        country=self.country_edit.text(),
-                                                        timeout_s=self.timeout_spinbox.value()
-                                                        )
-                started_works += 1
-        if not started_works:
-            self.log_write_line("No sources selected", 'error')
+        def on_end(count: int):
+            self.background_executing_tasks_count -= 1
+            self.log_write_line_signal.emit("{} new proxies added".format(count), 'success' if count > 0 else 'warn')
+            self.update_ui_signal.emit()
+
+        self.background_thread.parse_http_works(on_start, on_result, on_end, resources,
+                                                self.proxy_container.__contains__, self.max_count_spinbox.value(),
+                                                min_anonymity_level=AnonymityLevel(
+                                                    self.anonymity_combobox.currentIndex()),
+                                                types=selected_types,
+                                                country=self.country_edit.text(),
+                                                timeout_s=self.timeout_spinbox.value())
 
     @pyqtSlot()
     def on_export_button_pressed(self):
-        if len(self.proxy_container.proxy_list) == 0:
+        if len(self.proxy_container) == 0:
             self.log_write_line("Nothing to dump", 'error')
             return
         status_list = get_selected_list_widget_items_for_enum(self.status_list, ProxyStatus)
@@ -167,15 +179,17 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             return
         file_path = QtWidgets.QFileDialog.getSaveFileName(None, 'Save',
                                                           "proxylist_" + datetime.now().strftime("%Y-%m-%d_%H-%M-%S"),
-                                                          'json (*.json);;text (*.txt)')
+                                                          'json (*.json);;ndjson (*.ndjson);;text (*.txt)')
         if file_path[0] == '':
             return
         try:
             with open(file_path[0], 'w+') as w:
-                if file_path[0].endswith('.json'):
-                    w.write(self.proxy_container.dump_all_with_status_json(status_list))
+                if file_path[0].endswith('.ndjson'):
+                    self.proxy_container.write_all_with_status_ndjson(w, status_list)
+                elif file_path[0].endswith('.json'):
+                    self.proxy_container.write_all_with_status_json(w, status_list)
                 else:
-                    w.write(self.proxy_container.dump_all_with_status_txt(status_list))
+                    self.proxy_container.write_all_with_status_txt(w, status_list)
                 self.log_write_line("Successfully dumped", 'success')
         except Exception as e:
             self.log_write_line("An exception was thrown: {}".format(e), 'error')
@@ -183,7 +197,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
     @update_ui_after
     @pyqtSlot()
     def on_clear_button_pressed(self):
-        if len(self.proxy_container.proxy_list) == 0:
+        if len(self.proxy_container) == 0:
             self.log_write_line("Nothing to delete", 'error')
             return False
         status_list = get_selected_list_widget_items_for_enum(self.status_list, ProxyStatus)
@@ -193,6 +207,49 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         deleted_count = self.proxy_container.delete_all_with_status(status_list)
         self.log_write_line("{} proxies deleted".format(deleted_count), 'success' if deleted_count > 0 else 'warn')
 
+    @pyqtSlot()
+    def on_metrics_button_pressed(self):
+        port = self.metrics_port_spinbox.value()
+        try:
+            self.metrics_runner = asyncio.run_coroutine_threadsafe(
+                start_metrics_server(self.background_thread.metrics, port=port), self.background_thread.loop).result()
+        except Exception as e:
+            self.log_write_line("An exception was thrown: {}".format(e), 'error')
+            return
+        self.metrics_port_spinbox.setEnabled(False)
+        self.metrics_button.setEnabled(False)
+        self.log_write_line("Metrics on http://127.0.0.1:{}/metrics".format(port), 'success')
+
+    @update_ui_after
+    @synchronized_ui
+    @pyqtSlot()
+    def on_database_button_pressed(self):
+        path = self.database_edit.text()
+        if not path:
+            path = QtWidgets.QFileDialog.getSaveFileName(None, 'Database', "proxies.sqlite",
+                                                         'sqlite (*.sqlite);;all (*)',
+                                                         options=QtWidgets.QFileDialog.DontConfirmOverwrite)[0]
+        if path == '':
+            return False
+        try:
+            proxy_store = SqliteProxyStore(path)
+            loaded_count = proxy_store.load(self.proxy_container,
+                                            get_selected_list_widget_items_for_enum(self.status_list, ProxyStatus),
+                                            self.database_limit_spinbox.value())
+        except Exception as e:
+            self.log_write_line("An exception was thrown: {}".format(e), 'error')
+            return False
+        if self.proxy_store is not None:
+            self.proxy_container.listeners.remove(self.proxy_store)
+            self.proxy_store.close()
+        self.proxy_store = proxy_store
+        self.proxy_container.add_listener(proxy_store)
+        proxy_store.on_added(self.proxy_container.get_all())
+        self.database_edit.setText(path)
+        self.log_write_line("{0} proxies loaded from {1}, changes are saved to it".format(loaded_count, path),
+                            'success')
+        return True
+
     @update_ui_after
     @synchronized_ui
     @pyqtSlot()
@@ -200,49 +257,119 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         file_path = QtWidgets.QFileDialog.getOpenFileName(None, 'Open')
         if file_path[0] == '':
             return False
+        untyped = []
         try:
             with open(file_path[0], 'r+') as r:
-                if file_path[0].endswith('.json'):
+                if file_path[0].endswith('.ndjson'):
+                    added_count = self.proxy_container.add_from_ndjson_file(r)
+                elif file_path[0].endswith('.json'):
                     added_count = self.proxy_container.add_from_json(r.read())
                 else:
-                    added_count = self.proxy_container.add_from_txt(r.read(), lambda: ProxyType(
-                        display_messagebox_with_buttons([e.name for e in ProxyType], self.version,
-                                                        "If type don't not specified use ")))
+                    added_count = self.proxy_container.add_from_txt_file(
+                        r, None, on_untyped=lambda host, port: untyped.append((host, port)))
         except Exception as e:
             self.log_write_line("An exception was thrown: {}".format(e), 'error')
             return False
         self.log_write_line("{} proxies added".format(added_count), 'success' if added_count > 0 else 'warn')
+        if untyped:
+            self.detect_proxy_types(untyped)
+
+    def detect_proxy_types(self, addresses: List[Tuple[str, int]]):
+        self.log_write_line("Detecting type of {} proxies...".format(len(addresses)))
+
+        def on_start():
+            self.background_executing_tasks_count += 1
+
+        def on_result(proxies: List[Proxy]):
+            self.proxy_container.add_new_list(proxies)
+            self.update_ui_signal.emit()
+
+        def on_end(detected_count: int, count: int):
+            self.background_executing_tasks_count -= 1
+            self.log_write_line_signal.emit("{0} of {1} proxies detected, {2} undetected added as {3}".format(
+                detected_count, count, count - detected_count, self.undetected_proxy_type.name),
+                'success' if detected_count == count else 'warn')
+            self.update_ui_signal.emit()
+
+        self.background_thread.detect_http_works(on_start, on_result, on_end, addresses,
+                                                 self.checking_threads_spinbox.value() *
+                                                 self.tcp_probe_concurrency_factor, self.tcp_probe_timeout_s,
+                                                 fallback_type=self.undetected_proxy_type)
 
     @synchronized_ui
     @pyqtSlot()
     def on_checking_start_button_pressed(self):
-        check_list = self.proxy_container.get_all_with_status(
-            get_selected_list_widget_items_for_enum(self.status_list, ProxyStatus))
+        status_list = get_selected_list_widget_items_for_enum(self.status_list, ProxyStatus)
+        if self.force_recheck_checkbox.isChecked():
+            check_list = self.proxy_container.get_all_with_status(status_list)
+        else:
+            check_list = self.proxy_container.get_stale_with_status(status_list)
+        fresh_count = sum(self.proxy_container.get_count_all_by_status()[status.value] for status in status_list) \
+            - len(check_list)
+        if fresh_count:
+            self.log_write_line("{} recently checked proxies skipped".format(fresh_count), 'warn')
         if len(check_list) == 0:
             self.log_write_line("Nothing to check", 'error')
             return False
         threads = self.checking_threads_spinbox.value()
+        processes = self.checking_processes_spinbox.value()
         checking_class = None
         for i in range(self.checkers_list.count()):
             if self.checkers_list.item(i).checkState() == Qt.Checked:
-                checking_class = self.checkers[i]
+                checking_class = proxylib.plugins.checkers.load(self.checkers[i])
         if checking_class is None:
             self.log_write_line("Checker not selected", 'error')
             return False
 
+        last_update = [time.monotonic()]
+
         def on_start():
-            self.background_executing_tasks_count += 1
-            self.log_write_line_signal.emit("Checking {} proxies with {} threads".format(len(check_list), threads),
+            self.log_write_line_signal.emit("Checking {} proxies with up to {} threads".format(len(check_list), threads),
                                             'default')
 
-        def on_end(result):
+        def on_result(proxy: Proxy, result):
+            if self.proxy_store is not None:
+                self.proxy_store.record_check(proxy)
+            if time.monotonic() - last_update[0] >= self.checking_ui_update_interval_s:
+                last_update[0] = time.monotonic()
+                self.update_ui_signal.emit()
+
+        def on_end(count: int):
             self.background_executing_tasks_count -= 1
             self.log_write_line_signal.emit("Successfully checked", 'default')
             self.update_ui_signal.emit()
 
-        self.background_thread.multiple_http_works(on_start, on_end, check_list, threads, checking_class.check,
-                                                   min_speed_s=self.checking_timeout_spinbox.value(),
-                                                   max_retries=self.checking_retries_spinbox.value(),
-                                                   url_override=self.checking_url_edit.text(),
-                                                   pattern_override=self.checking_pattern_edit.text()
-                                                   )
+        checking_kwargs = dict(min_speed_s=self.checking_timeout_spinbox.value(),
+                               max_retries=self.checking_retries_spinbox.value(),
+                               url_override=self.checking_url_edit.text(),
+                               pattern_override=self.checking_pattern_edit.text())
+
+        def on_prepare_start():
+            self.background_executing_tasks_count += 1
+
+        def on_prepared(result: Union[Exception, Dict[str, Any]]):
+            if isinstance(result, Exception):
+                self.background_executing_tasks_count -= 1
+                self.log_write_line_signal.emit("{0} can not start: {1}".format(checking_class.description(),
+                                                                                  result), 'error')
+                return
+            checking_kwargs.update(result)
+            if processes > 1:
+                max_probe_workers = threads * self.tcp_probe_concurrency_factor // processes \
+                    if self.tcp_probe_checkbox.isChecked() else 0
+                sharded_http_works(on_start, on_result, on_end, check_list, processes, max(1, threads // processes),
+                                   checking_class.check, max_probe_workers=max_probe_workers,
+                                   probe_timeout_s=self.tcp_probe_timeout_s, **checking_kwargs)
+            elif self.tcp_probe_checkbox.isChecked():
+                self.background_thread.tiered_http_works(on_start, on_result, on_end, check_list,
+                                                         threads * self.tcp_probe_concurrency_factor,
+                                                         self.tcp_probe_timeout_s, threads, checking_class.check,
+                                                         **checking_kwargs)
+            else:
+                self.background_thread.adaptive_http_works(on_start, on_result, on_end, check_list,
+                                                           AdaptiveLimiter(threads), checking_class.check,
+                                                           **checking_kwargs)
+
+        self.background_thread.single_http_work(on_prepare_start, on_prepared, checking_class.prepare,
+                                                allow_private_judge=self.allow_private_judge_checkbox.isChecked(),
+                                                **checking_kwargs)
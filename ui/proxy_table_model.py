@@ -0,0 +1,119 @@
+from collections import deque
+from enum import Enum
+from threading import Lock
+from typing import List, Dict, Any, Deque, Tuple, Set
+
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+
+from proxylib.types import Proxy, ProxyStatus
+from proxylib.utils import ProxyContainer, ProxyContainerListener
+
+
+class ProxyTableModel(QAbstractTableModel, ProxyContainerListener):
+    fetch_batch_size = 1000
+    reset_threshold = 0.25
+
+    def __init__(self, container: ProxyContainer, parent=None):
+        super(ProxyTableModel, self).__init__(parent)
+        self.columns = Proxy.fields
+        self._rows: List[Proxy] = []
+        self._row_of: Dict[Proxy, int] = {}
+        self._fetched: int = 0
+        # Container listeners are called from the event loop thread, changes are applied in refresh()
+        self._journal: Deque[Tuple[bool, List[Proxy]]] = deque()
+        self._journal_lock = Lock()
+        self._changed: Set[Proxy] = set()
+        self.on_added(container.get_all())
+        container.add_listener(self)
+
+    def on_added(self, proxies: List[Proxy]) -> None:
+        with self._journal_lock:
+            self._journal.append((True, proxies))
+
+    def on_removed(self, proxies: List[Proxy]) -> None:
+        with self._journal_lock:
+            self._journal.append((False, proxies))
+
+    def on_status_changed(self, proxy: Proxy, old_status: ProxyStatus) -> None:
+        with self._journal_lock:
+            self._changed.add(proxy)
+
+    def refresh(self) -> None:
+        with self._journal_lock:
+            journal, self._journal = self._journal, deque()
+            changed, self._changed = self._changed, set()
+        for added, proxies in journal:
+            if added:
+                self._append_rows(proxies)
+            else:
+                self._remove_rows(proxies)
+        changed_rows = [row for row in (self._row_of.get(proxy) for proxy in changed)
+                        if row is not None and row < self._fetched]
+        if changed_rows:
+            self.dataChanged.emit(self.index(min(changed_rows), 0),
+                                  self.index(max(changed_rows), len(self.columns) - 1))
+
+    def _append_rows(self, proxies: List[Proxy]) -> None:
+        for proxy in proxies:
+            if proxy not in self._row_of:
+                self._row_of[proxy] = len(self._rows)
+                self._rows.append(proxy)
+        if self._fetched < self.fetch_batch_size:
+            self.fetchMore(QModelIndex())
+
+    def _remove_rows(self, proxies: List[Proxy]) -> None:
+        if len(proxies) > len(self._rows) * self.reset_threshold:
+            removed = set(proxies)
+            self.beginResetModel()
+            self._rows = [proxy for proxy in self._rows if proxy not in removed]
+            self._row_of = {proxy: row for row, proxy in enumerate(self._rows)}
+            self._fetched = min(len(self._rows), max(self._fetched, self.fetch_batch_size))
+            self.endResetModel()
+            return
+        for proxy in proxies:
+            row = self._row_of.pop(proxy, None)
+            if row is None:
+                continue
+            last = len(self._rows) - 1
+            if row != last:
+                self._rows[row] = self._rows[last]
+                self._row_of[self._rows[row]] = row
+                if row < self._fetched:
+                    self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.columns) - 1))
+            if last < self._fetched:
+                self.beginRemoveRows(QModelIndex(), last, last)
+                self._rows.pop()
+                self._fetched -= 1
+                self.endRemoveRows()
+            else:
+                self._rows.pop()
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else self._fetched
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.columns)
+
+    def canFetchMore(self, parent: QModelIndex) -> bool:
+        return not parent.isValid() and self._fetched < len(self._rows)
+
+    def fetchMore(self, parent: QModelIndex) -> None:
+        count = min(self.fetch_batch_size, len(self._rows) - self._fetched)
+        if parent.isValid() or count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self._fetched, self._fetched + count - 1)
+        self._fetched += count
+        self.endInsertRows()
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole) -> Any:
+        if role != Qt.DisplayRole or not index.isValid() or index.row() >= self._fetched:
+            return None
+        value = getattr(self._rows[index.row()], self.columns[index.column()], None)
+        return value.name if isinstance(value, Enum) else str(value)
+
+    def headerData(self, section: int, orientation: Qt.Orientation, role: int = Qt.DisplayRole) -> Any:
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.columns[section]
+        return str(section + 1)